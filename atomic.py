@@ -0,0 +1,74 @@
+from pathlib import Path
+from typing import BinaryIO
+import os
+import tempfile
+
+WRITE_BUFFER = 8 * 1024 * 1024
+
+
+class AtomicFile:
+    """
+    Writes go to a hidden temp file next to the target, which is fsynced and
+    renamed over it on success and removed on failure, so readers only ever
+    see the old file or the complete new one.
+    """
+
+    def __init__(self, path: Path, buffering: int = WRITE_BUFFER, preallocate: int = 0):
+        self.path = Path(path)
+        self.buffering = buffering
+        self.preallocate = preallocate
+        self.fp: BinaryIO = None
+        self._partial: Path = None
+        return
+
+    def __enter__(self) -> BinaryIO:
+        fd, name = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+        )
+        self._partial = Path(name)
+        if self.preallocate > 0 and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, self.preallocate)
+            except OSError:
+                pass  # not supported by this filesystem, the file just grows
+        self.fp = os.fdopen(fd, "wb", buffering=self.buffering)
+        return self.fp
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.fp.close()
+            self._partial.unlink(missing_ok=True)
+            return False
+        try:
+            self.fp.truncate()  # drop whatever preallocation went unused
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+            self.fp.close()
+            mode = self.path.stat().st_mode if self.path.exists() else 0o644
+            os.chmod(self._partial, mode & 0o777)
+            os.replace(self._partial, self.path)
+        except BaseException:
+            self.fp.close()
+            self._partial.unlink(missing_ok=True)
+            raise
+        fsync_dir(self.path.parent)
+        return False
+
+
+def fsync_dir(path: Path):
+    # makes the rename itself durable; not every platform can open a directory
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_bytes(path: Path, data: bytes):
+    with AtomicFile(path, buffering=-1) as fp:
+        fp.write(data)
@@ -4,11 +4,13 @@ import os
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
 import pygame
 from files import TempTree
+from ingest import default_index
+from pak import PakReader
 from schemas import SessionEvents
 from schemas import OutputType
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 from mutagen.mp3 import MP3
-from typing import TYPE_CHECKING, List, Callable
+from typing import TYPE_CHECKING, List, Callable, Union
 import threading
 import time
 
@@ -17,15 +19,45 @@ if TYPE_CHECKING:
 
 class TrackInfo:
 
-    def __init__(self, path: Path):
-        self.name = path.name
+    def __init__(self, path: Union[Path, str], pak: PakReader = None):
+        # pak-backed tracks keep the member name as their path
+        self.name = PurePosixPath(path).name if pak is not None else path.name
         self.path = path
+        self.pak = pak
+        # worked out on first use; tables redraw it on every refresh
+        self._duration: float = None
+
+    def open(self):
+        if self.pak is not None:
+            return self.pak.open(self.path, seekable=True)
+        return open(self.path, "rb")
+
+    def source(self):
+        # what pygame.mixer.music.load gets: a path on disk or a file object
+        return self.path if self.pak is None else self.open()
 
     def get_duration(self):
-        try:
-            return MP3(self.path).info.length
-        except Exception as e:
-            return 0
+        if self._duration is None:
+            try:
+                if self.pak is None:
+                    self._duration = self._indexed_duration()
+                else:
+                    with self.open() as f:
+                        self._duration = MP3(f).info.length
+            except Exception as e:
+                self._duration = 0
+        return self._duration
+
+    def _indexed_duration(self):
+        # files unchanged since an earlier import cost a stat and a lookup
+        index = default_index()
+        known = index.lookup(self.path) if index is not None else None
+        if known is not None and known.duration is not None:
+            return known.duration
+        info = MP3(self.path).info
+        if index is not None:
+            index.record(self.path, duration=info.length, bitrate=info.bitrate // 1000)
+        return info.length
 
     def get_duration_str(self):
         secs = int(self.get_duration())
@@ -36,7 +68,8 @@ class TrackInfo:
 
 class AudioManager:
 
-    def __init__(self, session: "Session"):
+    def __init__(self, session: "Session", tree: TempTree):
+        self.tree = tree
         self.assets = []
         self.playing = False
         self.track_index = 0
@@ -44,19 +77,71 @@ class AudioManager:
         self._progress = 0
         self._progess_callbacks: List[Callable[[float], None]] = []
         self.on_track_changed_callbacks: List[Callable[[TrackInfo], None]] = []
+        self.pak: PakReader = None
+        self._stream = None
 
         self.session.events.on(SessionEvents.tree_loaded, self._on_tree_loaded)
         
 
     def _on_tree_loaded(self, tree: TempTree):
+        self._close_pak()
         self.assets = (
-            [TrackInfo(track) for track in TempTree.tracks()]
-            + [TrackInfo(TempTree.intro())]
-            + [TrackInfo(interrupt) for interrupt in TempTree.interrupts()]
-            + [TrackInfo(sfx) for sfx in TempTree.sfx()]
+            [TrackInfo(track) for track in self.tree.tracks()]
+            + [TrackInfo(self.tree.intro())]
+            + [TrackInfo(interrupt) for interrupt in self.tree.interrupts()]
+            + [TrackInfo(sfx) for sfx in self.tree.sfx()]
         )
         self.load()
 
+    def load_pak(self, pak: Union[Path, PakReader]):
+        # audition a finished pak in place; nothing is extracted to disk
+        if not isinstance(pak, PakReader):
+            pak = PakReader(pak)
+        if self.playing:
+            self.stop()
+        if self.pak is not pak:
+            self._close_pak()
+        self.pak = pak
+        names = pak.names()
+
+        def members(prefix: str):
+            return [
+                TrackInfo(name, pak)
+                for name in names
+                if name.startswith(prefix) and not name.endswith("/")
+            ]
+
+        self.track_index = 0
+        self.assets = (
+            members("tracks/")
+            + members("intro.mp3")
+            + members("interrupts/")
+            + members("sfx/")
+        )
+        self.load()
+
+    def _load_music(self, asset: TrackInfo):
+        source = asset.source()
+        if asset.pak is None:
+            pygame.mixer.music.load(source)
+        else:
+            pygame.mixer.music.load(source, asset.name)
+        # pygame keeps reading from the stream while it plays
+        self._release_stream()
+        if asset.pak is not None:
+            self._stream = source
+
+    def _close_pak(self):
+        self._release_stream()
+        if self.pak is not None:
+            self.pak.close()
+            self.pak = None
+
+    def _release_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
     def on_progress(self, callback: Callable[[float], None]):
         self._progess_callbacks.append(callback)
 
@@ -76,14 +161,15 @@ class AudioManager:
         pygame.mixer.music.set_volume(0.3)
         for asset in self.assets:
             try:
-                pygame.mixer.music.load(asset.path)
+                self._load_music(asset)
             except Exception as e:
                 print("")
                 self.session.io.write(
                     f"Failed to load asset: {asset.path} /", OutputType.error
                 )
                 self.session.io.write(f"├─ Error: {e}", OutputType.error)
-        self.call_on_track_changed(self.assets[self.track_index])
+        if self.assets:
+            self.call_on_track_changed(self.assets[self.track_index])
 
     def volume_up(self):
         pygame.mixer.music.set_volume(min(1.0, pygame.mixer.music.get_volume() + 0.1))
@@ -127,7 +213,7 @@ class AudioManager:
 
     def _play_current_track(self):
         try:
-            pygame.mixer.music.load(self.assets[self.track_index].path)
+            self._load_music(self.assets[self.track_index])
             pygame.mixer.music.play( fade_ms=5000 )
         except Exception as e:
             self.session.io.write(
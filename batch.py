@@ -0,0 +1,227 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+import argparse
+import json
+import os
+import sys
+import time
+
+from files import PAK_SIZE_LIMIT, FileHandler, RootDirectoryValidator, TempTree
+from compression import AUTO_CODEC, CODECS, DEFAULT_CODEC, summarize
+
+
+def pack_folder(
+    folder: str,
+    out_dir: str,
+    incremental: bool = False,
+    codec: str = DEFAULT_CODEC,
+    transcode: bool = False,
+    tmpfs: bool = False,
+    deep: bool = False,
+    dedup: bool = False,
+    copy: bool = False,
+):
+    # every pack gets a workspace of its own, so concurrent packs never collide
+    folder = Path(folder)
+    handler = FileHandler(TempTree(tmpfs=tmpfs))
+    result = {
+        "source": str(folder),
+        "pak": None,
+        "ok": False,
+        "error": None,
+        "size_mb": None,
+        "estimated_pak_size": None,
+        "pak_size": None,
+        "timings": {},
+    }
+    started = time.perf_counter()
+    try:
+        validator = RootDirectoryValidator(folder, verbose=False, deep=deep, workers=1)
+        valid = validator.validate()
+        result["timings"]["validate"] = time.perf_counter() - started
+        if validator.inventory is not None and validator.inventory.probes:
+            probes = validator.inventory.probes.values()
+            result["probe"] = {
+                "files": len(probes),
+                "scanned": sum(report.scanned for report in probes),
+                "partial": sum(1 for report in probes if not report.complete()),
+                "failed": {
+                    str(report.path.relative_to(folder)): report.error
+                    for report in probes
+                    if not report.ok()
+                },
+            }
+        if not valid:
+            result["error"] = validator.error or f"Invalid directory {folder}"
+            return result
+
+        mark = time.perf_counter()
+        staged = handler.stage(folder, copy=copy, inventory=validator.inventory)
+        if staged is not None:
+            result["stage"] = staged.to_dict()
+        if not handler.tree.has_metadata():
+            result["error"] = f"{folder} has no metadata.json"
+            return result
+        result["size_mb"] = validator.inventory.total_size() / (1024 * 1024)
+        result["estimated_pak_size"] = handler.estimate_pak_size(codec, dedup)
+        result["timings"]["size"] = time.perf_counter() - mark
+
+        if transcode and result["estimated_pak_size"] > PAK_SIZE_LIMIT:
+            mark = time.perf_counter()
+            bitrate, reports = handler.transcode(workers=1)
+            result["transcode"] = {
+                "bitrate": bitrate,
+                "encoded": sum(1 for report in reports if not report.skipped),
+                "cached": sum(1 for report in reports if report.cached),
+                "saved": sum(report.saved() for report in reports),
+            }
+            result["estimated_pak_size"] = handler.estimate_pak_size(codec, dedup)
+            result["timings"]["transcode"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        pak_name = str(Path(out_dir) / folder.name)
+        report = handler.pak_temp(
+            pak_name, incremental=incremental, workers=1, codec=codec, dedup=dedup
+        )
+        result["timings"]["pack"] = time.perf_counter() - mark
+        result["pak"] = pak_name + ".pak"
+        result["pak_size"] = os.path.getsize(result["pak"])
+        result["summary"] = summarize(report)
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        handler.tree.cleanup(wait=True)
+        result["timings"]["total"] = time.perf_counter() - started
+    return result
+
+
+def check_names(folders: List[str]):
+    # every pak is named after its folder, so two folders sharing a name
+    # would overwrite each other's pak in out_dir
+    seen = {}
+    for folder in folders:
+        seen.setdefault(Path(folder).name, []).append(str(folder))
+    clashes = [paths for paths in seen.values() if len(paths) > 1]
+    if clashes:
+        raise ValueError(
+            "Folders would pack to the same .pak name: "
+            + "; ".join(", ".join(paths) for paths in clashes)
+        )
+
+
+def pack_all(
+    folders: List[str],
+    out_dir: str,
+    jobs: int = None,
+    incremental: bool = False,
+    codec: str = DEFAULT_CODEC,
+    transcode: bool = False,
+    tmpfs: bool = False,
+    deep: bool = False,
+    dedup: bool = False,
+    copy: bool = False,
+):
+    check_names(folders)
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(
+                pack_folder,
+                folder,
+                out_dir,
+                incremental,
+                codec,
+                transcode,
+                tmpfs,
+                deep,
+                dedup,
+                copy,
+            )
+            for folder in folders
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            yield result
+    wall = time.perf_counter() - started
+    yield {
+        "summary": {
+            "paks": len(results),
+            "ok": sum(1 for result in results if result["ok"]),
+            "failed": sum(1 for result in results if not result["ok"]),
+            "size_mb": sum(result["size_mb"] or 0 for result in results),
+            "pak_bytes": sum(result["pak_size"] or 0 for result in results),
+            "wall_seconds": wall,
+            "busy_seconds": sum(result["timings"]["total"] for result in results),
+        }
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description="Validate and pack many pak structured folders without the interactive UI."
+    )
+    parser.add_argument("folders", nargs="+", help="pak structured folders to pack")
+    parser.add_argument("-o", "--out", default=".", help="directory the .pak files go to")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="concurrent packs (default: cpu count)")
+    parser.add_argument("--incremental", action="store_true", help="reuse unchanged members of existing paks")
+    parser.add_argument(
+        "--codec",
+        default=DEFAULT_CODEC,
+        choices=list(CODECS) + [AUTO_CODEC],
+        help=f"codec for compressible members (default: {DEFAULT_CODEC})",
+    )
+    parser.add_argument(
+        "--transcode",
+        action="store_true",
+        help="re-encode tracks and interrupts of over-budget folders with a local ffmpeg/lame",
+    )
+    parser.add_argument(
+        "--tmpfs", action="store_true", help="put the per-pack workspaces on /dev/shm"
+    )
+    parser.add_argument(
+        "--deep",
+        action="store_true",
+        help="scan the MP3 frames of every audio file before packing",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="store identical files once; the copies are only visible to pakkit's own reader",
+    )
+    parser.add_argument(
+        "--copy",
+        action="store_true",
+        help="pack a private copy of each folder instead of reading it in place",
+    )
+    args = parser.parse_args(argv)
+    try:
+        check_names(args.folders)
+    except ValueError as e:
+        parser.error(str(e))
+
+    failed = False
+    # one JSON object per line: a result per pak, then the summary
+    for line in pack_all(
+        args.folders,
+        args.out,
+        args.jobs,
+        args.incremental,
+        args.codec,
+        args.transcode,
+        args.tmpfs,
+        args.deep,
+        args.dedup,
+        args.copy,
+    ):
+        failed = failed or line.get("ok") is False
+        print(json.dumps(line), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
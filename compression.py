@@ -0,0 +1,324 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+import bz2
+import os
+import time
+import zipfile
+import zlib
+
+# formats that are already entropy coded; deflate only gets a say after a probe
+PRECOMPRESSED_EXTENSIONS = {".mp3", ".png", ".gif"}
+# manifest.json carries a name, size and 64 hex digit digest per entry
+MANIFEST_ENTRY_SIZE = 110
+MANIFEST_RATIO = 0.6
+DEFAULT_CODEC = "deflate-6"
+AUTO_CODEC = "auto"
+# "auto" takes the fastest codec whose output is within this of the smallest
+AUTO_TOLERANCE = 0.02
+# how much of the pak's own files the "auto" benchmark compresses
+BENCHMARK_BUDGET = 4 * 1024 * 1024
+METHOD_NAMES = {
+    zipfile.ZIP_STORED: "stored",
+    zipfile.ZIP_DEFLATED: "deflated",
+    zipfile.ZIP_BZIP2: "bzip2",
+    zipfile.ZIP_LZMA: "lzma",
+}
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+    method: int
+    level: int = None
+
+    def compressor(self):
+        # None for stored; otherwise an object with compress() and flush()
+        if self.method == zipfile.ZIP_DEFLATED:
+            # raw deflate stream (wbits=-15), what zipfile.ZIP_DEFLATED writes
+            return zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        if self.method == zipfile.ZIP_BZIP2:
+            return bz2.BZ2Compressor(self.level)
+        if self.method == zipfile.ZIP_LZMA:
+            # prefixes the properties header zip readers expect
+            return zipfile.LZMACompressor()
+        return None
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = self.compressor()
+        if compressor is None:
+            return bytes(data)
+        return compressor.compress(data) + compressor.flush()
+
+
+CODECS: Dict[str, Codec] = {
+    "stored": Codec("stored", zipfile.ZIP_STORED),
+    **{
+        f"deflate-{level}": Codec(f"deflate-{level}", zipfile.ZIP_DEFLATED, level)
+        for level in range(1, 10)
+    },
+    "bzip2": Codec("bzip2", zipfile.ZIP_BZIP2, 9),
+    "lzma": Codec("lzma", zipfile.ZIP_LZMA),
+}
+
+
+def get_codec(name: str) -> Codec:
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {name!r}, expected one of {', '.join(CODECS)} or {AUTO_CODEC}")
+    return CODECS[name]
+
+
+def decompressor(method: int):
+    if method == zipfile.ZIP_DEFLATED:
+        return zlib.decompressobj(-15)
+    if method == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Decompressor()
+    if method == zipfile.ZIP_LZMA:
+        return zipfile.LZMADecompressor()
+    raise NotImplementedError(f"Unsupported compression method {method}")
+
+
+@dataclass
+class EntryReport:
+    arcname: str
+    method: int
+    file_size: int
+    compress_size: int
+    cpu_seconds: float
+    reused: bool = False
+    alias_of: str = None
+
+    def saved(self) -> int:
+        return self.file_size - self.compress_size
+
+    def method_name(self) -> str:
+        if self.alias_of is not None:
+            return "alias"
+        return METHOD_NAMES.get(self.method, str(self.method))
+
+    def to_dict(self):
+        return {
+            "arcname": self.arcname,
+            "method": self.method_name(),
+            "file_size": self.file_size,
+            "compress_size": self.compress_size,
+            "saved": self.saved(),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "reused": self.reused,
+            "alias_of": self.alias_of,
+        }
+
+
+class CompressionPolicy:
+    def __init__(
+        self,
+        min_saving: float = 0.03,
+        probe_size: int = 64 * 1024,
+        probe_count: int = 3,
+        span: int = 1024 * 1024,
+    ):
+        self.min_saving = min_saving
+        self.probe_size = probe_size
+        self.probe_count = probe_count
+        # probes only look at the first chunk ingest_file reads, so choose()
+        # on a path and choose_sample() on that chunk always agree
+        self.span = span
+        return
+
+    def windows(self, length: int) -> List[int]:
+        length = min(length, self.span)
+        step = max(0, length - self.probe_size) // max(1, self.probe_count - 1)
+        offsets = []
+        for i in range(self.probe_count):
+            offsets.append(i * step)
+            if i * step + self.probe_size >= length:
+                break
+        return offsets
+
+    def sample_ratio(self, data: bytes) -> float:
+        # compressed/raw ratio over a few windows spread across the buffer
+        data = data[: self.span]
+        raw = 0
+        packed = 0
+        for offset in self.windows(len(data)):
+            window = data[offset : offset + self.probe_size]
+            raw += len(window)
+            packed += len(zlib.compress(window, 1))
+        return packed / raw if raw else 1.0
+
+    def probe(self, path: Path, codec: Codec = None) -> float:
+        # sample_ratio over the file without reading more than the windows;
+        # with a codec, the ratio that codec gets on the same windows
+        size = os.path.getsize(path)
+        raw = 0
+        packed = 0
+        with open(path, "rb") as f:
+            for offset in self.windows(size):
+                f.seek(offset)
+                window = f.read(min(self.probe_size, self.span - offset))
+                raw += len(window)
+                packed += len(zlib.compress(window, 1) if codec is None else codec.compress(window))
+        return packed / raw if raw else 1.0
+
+    def choose(self, path: Path) -> int:
+        if os.path.getsize(path) == 0:
+            return zipfile.ZIP_STORED
+        if Path(path).suffix.lower() not in PRECOMPRESSED_EXTENSIONS:
+            return zipfile.ZIP_DEFLATED
+        if 1.0 - self.probe(path) >= self.min_saving:
+            return zipfile.ZIP_DEFLATED
+        return zipfile.ZIP_STORED
+
+    def choose_sample(self, suffix: str, data: bytes) -> int:
+        # same decision as choose(), made on the first chunk of a streamed read
+        if not data:
+            return zipfile.ZIP_STORED
+        if suffix.lower() not in PRECOMPRESSED_EXTENSIONS:
+            return zipfile.ZIP_DEFLATED
+        if 1.0 - self.sample_ratio(data) >= self.min_saving:
+            return zipfile.ZIP_DEFLATED
+        return zipfile.ZIP_STORED
+
+
+@dataclass
+class CodecBenchmark:
+    codec: str
+    raw_size: int
+    packed_size: int
+    seconds: float
+
+    def ratio(self) -> float:
+        return self.packed_size / self.raw_size if self.raw_size else 1.0
+
+    def to_dict(self):
+        return {
+            "codec": self.codec,
+            "raw_size": self.raw_size,
+            "packed_size": self.packed_size,
+            "ratio": round(self.ratio(), 4),
+            "seconds": round(self.seconds, 6),
+        }
+
+
+def benchmark_samples(
+    paths: Iterable[Path], policy: CompressionPolicy = None, budget: int = BENCHMARK_BUDGET
+) -> List[bytes]:
+    # the head of every file the policy would compress, split evenly across
+    # the budget; files it stores anyway say nothing about the codecs
+    policy = policy if policy is not None else CompressionPolicy()
+    paths = [path for path in paths if policy.choose(path) != zipfile.ZIP_STORED]
+    if not paths:
+        return []
+    share = min(policy.span, max(policy.probe_size, budget // len(paths)))
+    samples = []
+    for path in paths:
+        if budget <= 0:
+            break
+        with open(path, "rb") as f:
+            sample = f.read(min(share, budget))
+        samples.append(sample)
+        budget -= len(sample)
+    return samples
+
+
+def benchmark_codecs(samples: List[bytes], codecs: Iterable[str] = None) -> List[CodecBenchmark]:
+    results = []
+    raw = sum(len(sample) for sample in samples)
+    for name in codecs if codecs is not None else CODECS:
+        codec = get_codec(name)
+        started = time.perf_counter()
+        packed = sum(len(codec.compress(sample)) for sample in samples)
+        results.append(CodecBenchmark(name, raw, packed, time.perf_counter() - started))
+    return results
+
+
+def select_codec(benchmarks: List[CodecBenchmark], tolerance: float = AUTO_TOLERANCE) -> str:
+    # fastest codec within tolerance of the best ratio
+    if not benchmarks:
+        return DEFAULT_CODEC
+    best = min(result.packed_size for result in benchmarks)
+    candidates = [
+        result for result in benchmarks if result.packed_size <= best * (1.0 + tolerance)
+    ]
+    return min(candidates, key=lambda result: result.seconds).codec
+
+
+def auto_codec(
+    paths: Iterable[Path], policy: CompressionPolicy = None, tolerance: float = AUTO_TOLERANCE
+) -> Tuple[str, List[CodecBenchmark]]:
+    samples = benchmark_samples(paths, policy)
+    if not samples:
+        return DEFAULT_CODEC, []
+    benchmarks = benchmark_codecs(samples)
+    return select_codec(benchmarks, tolerance), benchmarks
+
+
+def summarize(report: List[EntryReport]):
+    return {
+        "entries": len(report),
+        "stored": sum(1 for entry in report if entry.method == zipfile.ZIP_STORED),
+        "reused": sum(1 for entry in report if entry.reused),
+        "aliased": sum(1 for entry in report if entry.alias_of is not None),
+        "file_size": sum(entry.file_size for entry in report),
+        "compress_size": sum(entry.compress_size for entry in report),
+        "saved": sum(entry.saved() for entry in report),
+        "cpu_seconds": round(sum(entry.cpu_seconds for entry in report), 6),
+    }
+
+
+def estimate_entry_size(
+    entry,
+    policy: CompressionPolicy = None,
+    upper_bound: bool = False,
+    codec: str = DEFAULT_CODEC,
+    known: int = None,
+) -> int:
+    # payload plus local header and central record for one PakEntry-like
+    # entry packed with codec; upper_bound swaps the sampled ratio for
+    # deflate's worst case. "auto" lands within tolerance of the best codec,
+    # which the default stands in for. known is the payload size an earlier
+    # pack got for the same content and codec, used instead of sampling
+    policy = policy if policy is not None else CompressionPolicy()
+    total = zipfile.sizeFileHeader + zipfile.sizeCentralDir + 2 * len(entry.arcname.encode("utf-8"))
+    if entry.path is None:
+        return total
+    if known is not None and not upper_bound:
+        return total + known
+    size = os.path.getsize(entry.path)
+    codec = get_codec(DEFAULT_CODEC if codec == AUTO_CODEC else codec)
+    if codec.method == zipfile.ZIP_STORED or policy.choose(entry.path) == zipfile.ZIP_STORED:
+        return total + size
+    if upper_bound:
+        return total + size + 5 * (size // 0xFFFF + 1)
+    return total + int(size * policy.probe(entry.path, codec)) + 2
+
+
+def estimate_overhead(entries: Iterable) -> int:
+    # end record plus the manifest.json member every pak carries
+    names = [entry.arcname for entry in entries if entry.path is not None]
+    manifest = 64 + sum(MANIFEST_ENTRY_SIZE + len(name) for name in names)
+    header = zipfile.sizeFileHeader + zipfile.sizeCentralDir + 2 * len("manifest.json")
+    return zipfile.sizeEndCentDir + header + int(manifest * MANIFEST_RATIO)
+
+
+def estimate_pak_size(
+    entries: Iterable,
+    policy: CompressionPolicy = None,
+    codec: str = DEFAULT_CODEC,
+    duplicates: Iterable[str] = (),
+    known: Dict[str, int] = None,
+) -> int:
+    # predicts the packed size from sampled ratios and zip framing, without
+    # packing; entries are PakEntry-like (arcname, path or None for dirs).
+    # duplicates are arcnames a dedup pack stores as aliases, which only
+    # cost their manifest.json line; known maps arcnames to payload sizes
+    # already measured for this codec
+    policy = policy if policy is not None else CompressionPolicy()
+    entries = list(entries)
+    duplicates = set(duplicates)
+    known = known or {}
+    return estimate_overhead(entries) + sum(
+        estimate_entry_size(entry, policy, codec=codec, known=known.get(entry.arcname))
+        for entry in entries
+        if entry.arcname not in duplicates
+    )
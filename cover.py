@@ -0,0 +1,88 @@
+from pathlib import Path
+from typing import Dict, List
+import os
+import tempfile
+from manifest import hash_file
+from ingest import CACHE_ROOT
+
+try:
+    from PIL import Image
+except ImportError:  # optional; without Pillow covers go into the pak as they are
+    Image = None
+
+# longest edge of each rendition; the first one is the pak's cover, the
+# rest are optional thumbnails (e.g. [512, 128] adds cover-128.png)
+COVER_SIZES = [512]
+# frames an animated GIF cover keeps; the rest of the animation is dropped
+MAX_COVER_FRAMES = 24
+CACHE_DIR = CACHE_ROOT / "covers"
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def cover_name(size: int, suffix: str = ".png") -> str:
+    return f"cover{suffix}" if size == COVER_SIZES[0] else f"cover-{size}{suffix}"
+
+
+def cache_path(digest: str, size: int, cache_dir: Path = CACHE_DIR, suffix: str = ".png") -> Path:
+    return Path(cache_dir) / f"{digest}-{size}{suffix}"
+
+
+def _save(frames: List, path: Path, durations: List[int] = None, loop: int = 0):
+    # a bare PNG, or a GIF when there are several frames: no text chunks,
+    # EXIF or ICC profile carried over
+    fd, partial = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=path.suffix)
+    os.close(fd)
+    try:
+        if len(frames) > 1:
+            frames[0].save(
+                partial,
+                "GIF",
+                save_all=True,
+                append_images=frames[1:],
+                duration=durations,
+                loop=loop,
+                optimize=True,
+            )
+        else:
+            frames[0].save(partial, "PNG", optimize=True)
+        os.replace(partial, path)
+    finally:
+        Path(partial).unlink(missing_ok=True)
+
+
+def normalize(path: Path, sizes: List[int] = None, cache_dir: Path = CACHE_DIR) -> Dict[int, Path]:
+    # size -> cached rendition of the cover at path, decoding it at most
+    # once: a PNG, or a GIF of at most MAX_COVER_FRAMES frames when the cover
+    # is animated; {} when Pillow is missing or the file is not an image
+    sizes = sizes if sizes is not None else COVER_SIZES
+    if Image is None or os.path.getsize(path) == 0:
+        return {}
+    digest = hash_file(path)
+    for suffix in (".png", ".gif"):
+        renditions = {size: cache_path(digest, size, cache_dir, suffix) for size in sizes}
+        if all(target.is_file() for target in renditions.values()):
+            return renditions
+    try:
+        with Image.open(path) as source:
+            count = min(getattr(source, "n_frames", 1), MAX_COVER_FRAMES)
+            frames, durations = [], []
+            for index in range(count):
+                source.seek(index)
+                alpha = "A" in source.getbands() or "transparency" in source.info
+                frames.append(source.convert("RGBA" if alpha else "RGB"))
+                durations.append(source.info.get("duration", 100))
+            loop = source.info.get("loop", 0)
+    except (OSError, ValueError, EOFError):
+        return {}
+    suffix = ".gif" if len(frames) > 1 else ".png"
+    renditions = {size: cache_path(digest, size, cache_dir, suffix) for size in sizes}
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    # largest first, so each smaller rendition is resampled from the previous one
+    for size in sorted(sizes, reverse=True):
+        for frame in frames:
+            frame.thumbnail((size, size), Image.LANCZOS)
+        _save(frames, renditions[size], durations, loop)
+    return renditions
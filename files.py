@@ -1,16 +1,44 @@
 from pathlib import Path
 
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
 from schemas import OutputType, SessionEvents
 import json
-from typing import Dict, List, TYPE_CHECKING, Any
+from typing import Dict, List, Set, Tuple, TYPE_CHECKING, Any
 import shutil
+import tempfile
+import threading
+import uuid
+import zipfile
 import utils
 import os
 from message import messages
 from datetime import datetime
-import zipfile
 from typing import Callable
+from pak import PakEntry, PakProgress, PakReader, PakWriter
+from compression import (
+    AUTO_CODEC,
+    DEFAULT_CODEC,
+    estimate_entry_size,
+    estimate_overhead,
+    estimate_pak_size,
+)
+from volumes import write_volumes
+from transcode import BITRATES, choose_bitrate, duration, transcode_all
+from cover import COVER_SIZES, cover_name, normalize
+from staging import StageReport, stage_tree
+from atomic import write_bytes
+from probe import PROBE_BUDGET, ProbeReport, probe_all, scan_limits
+from ingest import VERDICT_OK, IngestIndex, default_index
+from planner import KIND_PRIORITY, PruneItem, PrunePlan, metadata_priorities, plan_prune
+
+PAK_SIZE_LIMIT = 10 * 1024 * 1024
+# what the deep validation stage scans for MP3 frames
+AUDIO_KINDS = {"tracks", "interrupts", "sfx", "intro"}
+# entries that stay in the index pak when a pak is split into volumes
+INDEX_ENTRIES = {"metadata.json", "README.md"} | {
+    cover_name(size, suffix) for size in COVER_SIZES for suffix in (".png", ".gif")
+}
 
 if TYPE_CHECKING:
     from session import Session  # for static checking only
@@ -26,6 +54,10 @@ class DirectoryValidator(ABC):
         self.path = path
         self.allowed_subfolders = allowed_subfolders
         self.allowed_files = allowed_files
+        # (name, ext) -> name, so checking a file is one lookup
+        self._allowed = {
+            (name, ext): name for name, exts in allowed_files.items() for ext in exts
+        }
 
     @abstractmethod
     def validate(self):
@@ -42,10 +74,7 @@ class DirectoryValidator(ABC):
         return file.name.removesuffix(file.suffix)
 
     def extension_allowed(self, fname: str, fext: str) -> bool:
-        for file in self.allowed_files.keys():
-            if (file == fname) and (fext in self.allowed_files[file]):
-                return True
-        return False
+        return (fname, fext) in self._allowed
 
 
 class AssetDirectoryValidator(DirectoryValidator):
@@ -70,8 +99,55 @@ class AssetDirectoryValidator(DirectoryValidator):
         return True
 
 
+@dataclass
+class InventoryItem:
+    path: Path
+    kind: str  # metadata, cover, intro, README, or the subfolder it sits in
+    size: int
+
+
+@dataclass
+class Inventory:
+    root: Path
+    items: List[InventoryItem] = field(default_factory=list)
+    subfolders: List[str] = field(default_factory=list)
+    rejections: List[str] = field(default_factory=list)
+    # folder -> (mtime_ns, name -> stat), the shape of TempTree's snapshots
+    folders: Dict[Path, Tuple[int, Dict[str, os.stat_result]]] = field(default_factory=dict)
+    # path -> MP3 frame scan, filled in by a deep validation
+    probes: Dict[Path, ProbeReport] = field(default_factory=dict)
+
+    def ok(self) -> bool:
+        return not self.rejections
+
+    def stat(self, item: InventoryItem) -> os.stat_result:
+        return self.folders[item.path.parent][1][item.path.name]
+
+    def audio(self) -> List[InventoryItem]:
+        return [
+            item
+            for item in self.items
+            if item.kind in AUDIO_KINDS and item.path.suffix.lower() == ".mp3"
+        ]
+
+    def total_size(self) -> int:
+        return sum(item.size for item in self.items)
+
+    def names(self) -> List[str]:
+        # top level, what FileHandler.list_files would have listed
+        return [item.path.name for item in self.items if item.path.parent == self.root] + self.subfolders
+
+
 class RootDirectoryValidator(DirectoryValidator):
-    def __init__(self, path: Path):
+    def __init__(
+        self,
+        path: Path,
+        verbose: bool = True,
+        deep: bool = False,
+        budget: int = PROBE_BUDGET,
+        workers: int = None,
+        index: IngestIndex = None,
+    ):
         super().__init__(
             path,
             ["tracks", "sfx", "interrupts"],
@@ -82,140 +158,385 @@ class RootDirectoryValidator(DirectoryValidator):
                 "README": [".md"],
             },
         )
+        self.verbose = verbose
+        # deep also scans the MP3 frames of every audio file, reading at
+        # most budget bytes in total
+        self.deep = deep
+        self.budget = budget
+        self.workers = workers
+        # verdicts of files unchanged since an earlier import are reused
+        self.index = index if index is not None else default_index()
+        self.error: str = None
+        self.inventory: Inventory = None
 
     def is_hidden_file(path: Path):
         return path.name.startswith(".") or ".DS_Store" in path.name
 
+    def reject(self, error: str):
+        self.error = error
+        if self.verbose:
+            utils.type_line(error, 0.04)
+        return False
+
     def validate(self):
         if not self.path.is_dir():
+            self.error = f"{self.path} is not a directory"
             return False
-        for file in iter(self.path.iterdir()):
-            if RootDirectoryValidator.is_hidden_file(file):  # ignore hidden files
-                continue
-            if file.is_dir() and file.name not in self.allowed_subfolders:
-                utils.type_line(f'subfolder "{file.name}" is not allowed', 0.04)
-                return False
-            if file.is_file() and not self.extension_allowed(
-                self.name(file), self.extension(file)
+        self.inventory = self.scan()
+        if self.deep and self.inventory.ok():
+            self.probe(self.inventory)
+        if not self.inventory.ok():
+            return self.reject(self.inventory.rejections[0])
+        return True
+
+    def probe(self, inventory: Inventory):
+        audio = inventory.audio()
+        limits = scan_limits([item.size for item in audio], self.budget)
+        pending: List[Tuple[InventoryItem, int]] = []
+        for item, limit in zip(audio, limits):
+            cached = self.index.lookup(item.path, inventory.stat(item)) if self.index else None
+            if cached is not None and cached.probe is not None and (
+                cached.probe["scanned"] >= min(limit, item.size)
             ):
-                utils.type_line(
-                    f'file extension "{self.extension(file)}" is not allowed in file "{self.name(file)}"',
-                    0.04,
+                inventory.probes[item.path] = ProbeReport.from_dict(cached.probe)
+            else:
+                pending.append((item, limit))
+        probes = probe_all(
+            [item.path for item, _ in pending],
+            workers=self.workers,
+            limits=[limit for _, limit in pending],
+        )
+        inventory.probes.update(probes)
+        if self.index is not None and probes:
+            self.index.record_many(
+                (item.path, inventory.stat(item), self.index_fields(probes[item.path]))
+                for item, _ in pending
+            )
+        for item in audio:
+            report = inventory.probes[item.path]
+            if not report.ok():
+                inventory.rejections.append(
+                    f'"{item.path.relative_to(self.path)}" is not a valid MP3: {report.error}'
                 )
-                return False
-        return True
+
+    def index_fields(self, report: ProbeReport) -> Dict[str, Any]:
+        fields = {"verdict": report.error or VERDICT_OK, "probe": report.to_dict()}
+        if report.ok() and report.complete():
+            fields["duration"] = report.seconds
+            if not report.vbr():
+                fields["bitrate"] = next(iter(report.bitrates))
+        return fields
+
+    def _scan_folder(self, folder: Path, inventory: Inventory, kind: str = None):
+        # one scandir of folder; kind is None for the root, whose files and
+        # subfolders are checked against the allowed names
+        mtime = os.stat(folder).st_mtime_ns
+        files: Dict[str, os.stat_result] = {}
+        subfolders = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if RootDirectoryValidator.is_hidden_file(entry):  # ignore hidden files
+                    continue
+                if entry.is_dir():
+                    if kind is not None:
+                        continue
+                    if entry.name not in self.allowed_subfolders:
+                        inventory.rejections.append(f'subfolder "{entry.name}" is not allowed')
+                    else:
+                        subfolders.append(entry.name)
+                    continue
+                if not entry.is_file():
+                    continue
+                path = folder / entry.name
+                item_kind = kind
+                if kind is None:
+                    item_kind = self._allowed.get((self.name(path), self.extension(path)))
+                    if item_kind is None:
+                        inventory.rejections.append(
+                            f'file extension "{self.extension(path)}" is not allowed in file "{self.name(path)}"'
+                        )
+                        continue
+                stat = entry.stat()
+                files[entry.name] = stat
+                inventory.items.append(InventoryItem(path, item_kind, stat.st_size))
+        inventory.folders[folder] = (mtime, files)
+        return subfolders
+
+    def scan(self) -> Inventory:
+        inventory = Inventory(self.path)
+        inventory.subfolders = self._scan_folder(self.path, inventory)
+        for subfolder in inventory.subfolders:
+            self._scan_folder(self.path / subfolder, inventory, subfolder)
+        return inventory
+
+
+def tree_layout(root: Path) -> Dict[str, Path]:
+    return {
+        "tracks": root / "tracks",
+        "sfx": root / "sfx",
+        "interrupts": root / "interrupts",
+        "metadata": root / "metadata.json",
+        "cover": root / "cover.png",
+        "gif": root / "cover.gif",
+        "intro": root / "intro.mp3",
+        "readme": root / "README.md",
+    }
+
+
+def discard(path: Path, wait: bool = False):
+    # renames path out of the way at once and removes it on a thread
+    path = Path(path)
+    if not path.exists():
+        return
+    trash = path.with_name(f".{path.name}.{uuid.uuid4().hex}.trash")
+    os.rename(path, trash)
+    remover = threading.Thread(target=shutil.rmtree, args=(trash,), kwargs={"ignore_errors": True})
+    remover.start()
+    if wait:
+        remover.join()
 
 
 class TempTree:
+    """
+    The folder being worked on, bound to a private workspace directory so
+    concurrent sessions never share (or wipe) each other's temp/.
+
+    Mounted read-only it is a view over the source folder: prunes are
+    recorded in _excluded and metadata edits go to an overlay dir inside
+    the workspace.
+    """
+
+    def __init__(self, workspace: Path = None, tmpfs: bool = False):
+        self.workspace = Path(workspace) if workspace is not None else TempTree.new_workspace(tmpfs)
+        self._default = self.workspace / "temp"
+        self._default.mkdir(parents=True, exist_ok=True)
+        self._path = self._default
+        self._temp = tree_layout(self._path)
+        self._read_only = False
+        self._excluded: Set[Path] = set()
+        self._overlay: Path = None
+        # transcoded stand-ins: the pak gets the replacement under the original name
+        self._substitutes: Dict[Path, Path] = {}
+        # folder -> (mtime_ns, name -> stat) from one scandir; listings and
+        # existence checks are answered from here until the folder changes
+        self._snapshots: Dict[Path, Tuple[int, Dict[str, os.stat_result]]] = {}
+        # bytes of every included file; None until first asked for, then kept
+        # current by prune instead of being recomputed
+        self._total_size: int = None
+        return
 
-    _path = Path("temp")
-    _temp = {
-        "tracks": _path / "tracks",
-        "sfx": _path / "sfx",
-        "interrupts": _path / "interrupts",
-        "metadata": _path / "metadata.json",
-        "cover": _path / "cover.png",
-        "gif": _path / "cover.gif",
-        "intro": _path / "intro.mp3",
-        "readme": _path / "README.md",
-    }
+    def new_workspace(tmpfs: bool = False) -> Path:
+        base = "/dev/shm" if tmpfs and os.path.isdir("/dev/shm") else None
+        return Path(tempfile.mkdtemp(prefix="pakkit-", dir=base))
+
+    def default_root(self) -> Path:
+        return self._default
+
+    def reset(self):
+        # empties the staging dir: one rename plus a background rmtree
+        self.unmount()
+        discard(self._default)
+        self._default.mkdir(parents=True, exist_ok=True)
+        self.invalidate()
+
+    def cleanup(self, wait: bool = False):
+        self.unmount()
+        discard(self.workspace, wait)
+
+    def mount(self, path: Path, read_only: bool = True):
+        self.unmount()
+        self._path = Path(path)
+        self._temp = tree_layout(self._path)
+        self._read_only = read_only
+        self._snapshots = {}
+        self._total_size = None
+
+    def unmount(self):
+        if self._overlay is not None:
+            shutil.rmtree(self._overlay, ignore_errors=True)
+        self._path = self._default
+        self._temp = tree_layout(self._path)
+        self._read_only = False
+        self._excluded = set()
+        self._overlay = None
+        self._substitutes = {}
+        self._snapshots = {}
+        self._total_size = None
+
+    def is_read_only(self):
+        return self._read_only
+
+    def root(self):
+        return self._path
+
+    def prune(self, path: Path):
+        path = Path(path)
+        if self._total_size is not None and self._included(path):
+            self._total_size -= self.size(path)
+        if self._read_only:
+            self._excluded.add(path)
+        else:
+            path.unlink()
+            self._snapshots.pop(path.parent, None)
+
+    def total_size(self) -> int:
+        if self._total_size is None:
+            self._total_size = sum(self.walk(self.size))
+        return self._total_size
+
+    def seed(self, inventory: "Inventory"):
+        # adopt a validator's scan of the mounted folder instead of rescanning
+        if inventory is not None and inventory.root == self._path:
+            self._snapshots.update(inventory.folders)
+            self._total_size = inventory.total_size()
+
+    def invalidate(self, folder: Path = None):
+        # for changes made behind the snapshot's back; None drops everything
+        self._total_size = None
+        if folder is None:
+            self._snapshots = {}
+        else:
+            self._snapshots.pop(Path(folder), None)
+
+    def _snapshot(self, folder: Path) -> Dict[str, os.stat_result]:
+        # one stat of the folder to validate, a scandir only when it changed
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            self._snapshots.pop(folder, None)
+            return {}
+        cached = self._snapshots.get(folder)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        files: Dict[str, os.stat_result] = {}
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file() and not RootDirectoryValidator.is_hidden_file(entry):
+                    files[entry.name] = entry.stat()
+        self._snapshots[folder] = (mtime, files)
+        return files
 
-    def __init__(self):
-        return 
+    def stat(self, path: Path) -> os.stat_result:
+        path = Path(path)
+        cached = self._snapshot(path.parent).get(path.name)
+        return cached if cached is not None else os.stat(path)
 
-    def tracks():
-        return [
-            (TempTree._temp["tracks"] / file.name)
-            for file in (TempTree._temp["tracks"]).iterdir()
-            if not RootDirectoryValidator.is_hidden_file(file)
-        ]
+    def size(self, path: Path) -> int:
+        return self.stat(path).st_size
 
-    def sfx():
-        return [
-            (TempTree._temp["sfx"] / file.name)
-            for file in (TempTree._temp["sfx"]).iterdir()
-            if not RootDirectoryValidator.is_hidden_file(file)
-        ]
+    def substitute(self, path: Path, replacement: Path):
+        self._substitutes[Path(path)] = Path(replacement)
+
+    def resolve(self, path: Path) -> Path:
+        return self._substitutes.get(Path(path), Path(path))
 
-    def interrupts():
+    def _included(self, path: Path):
+        return path not in self._excluded and path.name in self._snapshot(path.parent)
+
+    def _list(self, key: str):
+        folder: Path = self._temp[key]
         return [
-            (TempTree._temp["interrupts"] / file.name)
-            for file in (TempTree._temp["interrupts"]).iterdir()
-            if not RootDirectoryValidator.is_hidden_file(file)
+            folder / name
+            for name in self._snapshot(folder)
+            if folder / name not in self._excluded
         ]
 
-    def metadata(as_dict: bool = False):
-        if as_dict:
-            return json.loads((TempTree._temp["metadata"]).read_text())
-        return TempTree._temp["metadata"]
+    def tracks(self):
+        return self._list("tracks")
 
-    def write_metadata(data: dict):
-        (TempTree._temp["metadata"]).write_text(json.dumps(data))
+    def sfx(self):
+        return self._list("sfx")
 
-    def has_cover():
-        return (TempTree._temp["cover"]).exists() or (TempTree._temp["gif"]).exists()
+    def interrupts(self):
+        return self._list("interrupts")
 
-    def cover():
+    def metadata(self, as_dict: bool = False):
+        if as_dict:
+            return json.loads((self._temp["metadata"]).read_text())
+        return self._temp["metadata"]
+
+    def write_metadata(self, data: dict):
+        if self._read_only and self._overlay is None:
+            self._overlay = Path(tempfile.mkdtemp(prefix="overlay-", dir=self.workspace))
+            self._temp["metadata"] = self._overlay / "metadata.json"
+        # replaced rather than rewritten: a staged metadata.json may be a hard
+        # link to the user's original
+        write_bytes(self._temp["metadata"], json.dumps(data).encode("utf-8"))
+        self.invalidate(self._temp["metadata"].parent)
+
+    def has_cover(self):
+        return self._included(self._temp["cover"]) or self._included(
+            self._temp["gif"]
+        )
+
+    def cover(self):
         return (
-            TempTree._temp["cover"]
-            if (TempTree._temp["cover"]).exists()
-            else TempTree._temp["gif"]
+            self._temp["cover"]
+            if self._included(self._temp["cover"])
+            else self._temp["gif"]
         )
 
-    def has_intro():
-        return (TempTree._temp["intro"]).exists()
+    def has_intro(self):
+        return self._included(self._temp["intro"])
 
-    def intro():
-        return TempTree._temp["intro"]
+    def intro(self):
+        return self._temp["intro"]
 
-    def readme():
-        return TempTree._temp["readme"]
+    def readme(self):
+        return self._temp["readme"]
 
-    def has_readme():
-        return TempTree._temp["readme"].exists()
+    def has_readme(self):
+        return self._included(self._temp["readme"])
 
-    def has_metadata():
-        return TempTree._temp["metadata"].exists()
+    def has_metadata(self):
+        return self._included(self._temp["metadata"])
 
-    def list_files():
-        files: List[Path] = TempTree.tracks() + TempTree.sfx() + TempTree.interrupts()
-        if TempTree.has_metadata():
-            files.append(TempTree.metadata())
-        if TempTree.has_cover():
-            files.append(TempTree.cover())
-        if TempTree.has_intro():
-            files.append(TempTree.intro())
-        if TempTree.has_readme():
-            files.append(TempTree.readme())
+    def list_files(self):
+        files: List[Path] = self.tracks() + self.sfx() + self.interrupts()
+        if self.has_metadata():
+            files.append(self.metadata())
+        if self.has_cover():
+            files.append(self.cover())
+        if self.has_intro():
+            files.append(self.intro())
+        if self.has_readme():
+            files.append(self.readme())
         return files
 
-    def walk(actions: Callable[[Path], Any]):
-        for path in TempTree.tracks():
+    def walk(self, actions: Callable[[Path], Any]):
+        for path in self.tracks():
             yield actions(path)
-        for path in TempTree.sfx():
+        for path in self.sfx():
             yield actions(path)
-        for path in TempTree.interrupts():
+        for path in self.interrupts():
             yield actions(path)
-        if TempTree.has_metadata():
-            yield actions(TempTree.metadata())
-        if TempTree.has_cover():
-            yield actions(TempTree.cover())
-        if TempTree.has_intro():
-            yield actions(TempTree.intro())
-        if TempTree.has_readme():
-            yield actions(TempTree.readme())
+        if self.has_metadata():
+            yield actions(self.metadata())
+        if self.has_cover():
+            yield actions(self.cover())
+        if self.has_intro():
+            yield actions(self.intro())
+        if self.has_readme():
+            yield actions(self.readme())
         return
 
 class ProcessedResponse:
-    def __init__(self, valid: bool, error: str, path: Path):
+    def __init__(self, valid: bool, error: str, path: Path, inventory: Inventory = None):
         self.valid = valid
         self.error = error
         self.path = path
+        self.inventory = inventory
         return
 
 class FileHandler:
 
-    def __init__(self):
+    def __init__(self, tree: TempTree = None, index: IngestIndex = None):
+        self.tree = tree if tree is not None else TempTree()
+        self.index = index if index is not None else default_index()
+        if self.index is not None:
+            self.index.ignore(self.tree.workspace)
+        # ((path, size, mtime_ns), renditions) of the last cover normalized
+        self._cover = None
         return
 
     def list_files(path: Path):
@@ -224,13 +545,13 @@ class FileHandler:
             files.append(path.name)
         return files
 
-    def calc_total_pak_size(path: Path):
-        total_size = 0
-        for path in TempTree.walk(FileHandler.file_size_mb):
-            total_size += path
-        return total_size
+    def calc_total_pak_size(self, path: Path = None):
+        # raw size in MB of what is mounted; path is kept for old callers
+        return self.tree.total_size() / (1024 * 1024)
 
-    def process_file(candidate_path: str=None):
+    def process_file(candidate_path: str=None, deep: bool = False):
+        # deep adds the MP3 frame scan, which reads the audio itself; the UI
+        # leaves it to the [validate] command, batch to --deep
         if not candidate_path:
             return ProcessedResponse(
                 valid=False,
@@ -239,18 +560,31 @@ class FileHandler:
             )
         path = Path(candidate_path.strip('"').strip("'"))
 
-        if path.is_file():
+        if path.is_file() and path.suffix.lower() == ".pak":
+            # opened up front, so a junk file or a split index with no audio
+            # is refused here rather than when playback starts
+            try:
+                with PakReader(path) as pak:
+                    names = pak.names()
+            except (OSError, zipfile.BadZipFile) as e:
+                return ProcessedResponse(valid=False, error=f"Cannot open {path}: {e}", path=path)
+            if not any(name.startswith("tracks/") and not name.endswith("/") for name in names):
+                return ProcessedResponse(valid=False, error=f"{path} has no tracks to play", path=path)
+            return ProcessedResponse(valid=True, error=None, path=path)
+        elif path.is_file():
             return ProcessedResponse(
                 valid=False,
                 error=f"File {path} is not a directory",
                 path=None
             )
         elif path.is_dir():
-            if FileHandler.is_valid_candidate(path):
+            validator = RootDirectoryValidator(path, deep=deep)
+            if validator.validate():
                 return ProcessedResponse(
                     valid=True,
                     error=None,
-                    path=path
+                    path=path,
+                    inventory=validator.inventory,
                 )
             else:
                 return ProcessedResponse(
@@ -315,51 +649,249 @@ class FileHandler:
     #             messages["start_prompt"], OutputType.question, self.handle_file_dropped
     #         )
 
-    def copy_to_temp(path: Path):
-        # for path in path.iterdir():
-        #     utils.type_line(f"Copying {path} into temp", 0.04)
-        shutil.copytree(path, "temp", dirs_exist_ok=True)
+    def copy_to_temp(self, path: Path) -> StageReport:
+        # hard links or reflinks where the filesystem allows them, so staging
+        # a large folder costs metadata operations instead of a full copy
+        report = stage_tree(path, self.tree.default_root(), skip=RootDirectoryValidator.is_hidden_file)
+        self.tree.invalidate()
+        return report
+
+    def stage(self, path: Path, copy: bool = False, inventory: Inventory = None):
+        # by default the validated folder is packed in place instead of copied,
+        # and copy=True returns how the copy went as a StageReport; a finished
+        # pak is played through AudioManager.load_pak, not staged
+        if Path(path).suffix.lower() == ".pak":
+            raise ValueError(f"{path} is already a pak; play it with load_pak or extract it with unpack")
+        if copy:
+            self.clear_temp()
+            return self.copy_to_temp(path)
+        else:
+            self.tree.mount(path, read_only=True)
+            self.tree.seed(inventory)
+
+    def unpack(self, pak_path: Path, workers: int = None):
+        self.clear_temp()
+        root = self.tree.root()
+        with PakReader(pak_path) as pak:
+            paths = pak.extract_all(root, workers)
+        self.tree.invalidate()
+        return paths
 
     def is_valid_candidate(folder: Path):
         return RootDirectoryValidator(folder).validate()
 
-    def clear_temp():
-        for path in TempTree.tracks():
-            path.unlink()
-        for path in TempTree.sfx():
-            path.unlink()
-        for path in TempTree.interrupts():
-            path.unlink()
+    def clear_temp(self):
+        # drops a read-only view, or the staged copy in one background rmtree
+        self.tree.reset()
 
-        if TempTree.has_metadata():
-            TempTree.metadata().unlink()
-        if TempTree.has_cover():
-            TempTree.cover().unlink()
-        if TempTree.has_intro():
-            TempTree.intro().unlink()
-        if TempTree.has_readme():
-            TempTree.readme().unlink()
-
-    def pak_temp(pak_name: str):
-        with zipfile.ZipFile(
-            pak_name + ".pak", "w", zipfile.ZIP_DEFLATED
+    def pak_temp(
+        self,
+        pak_name: str,
+        incremental: bool = False,
+        workers: int = None,
+        preallocate: bool = False,
+        codec: str = DEFAULT_CODEC,
+        progress: Callable[[PakProgress], None] = None,
+        dedup: bool = False,
+    ):
+        with PakWriter(
+            pak_name + ".pak",
+            workers=workers,
+            codec=codec,
+            incremental=incremental,
+            dedup=dedup,
+            preallocate=preallocate,
+            progress=progress,
+            index=self.index,
+            root=self.tree.root(),
         ) as pak:
-            pak.write(TempTree.metadata(), arcname="metadata.json")
-            if TempTree.has_cover():
-                pak.write(TempTree.cover(), arcname="cover.png")
-            if TempTree.has_intro():
-                pak.write(TempTree.intro(), arcname="intro.mp3")
-            if TempTree.has_readme():
-                pak.write(TempTree.readme(), arcname="README.md")
-            pak.mkdir("tracks")
-            pak.mkdir("sfx")
-            pak.mkdir("interrupts")
-            for track in TempTree.tracks():
-                pak.write(track, arcname=f"tracks/{track.name}")
-            for sfx in TempTree.sfx():
-                pak.write(sfx, arcname=f"sfx/{sfx.name}")
-            for interrupt in TempTree.interrupts():
-                pak.write(interrupt, arcname=f"interrupts/{interrupt.name}")
+            for entry in self.pak_entries():
+                pak.add(entry)
+        return pak.report
+
+    def pak_split(
+        self,
+        pak_name: str,
+        cap: int = PAK_SIZE_LIMIT,
+        workers: int = None,
+        codec: str = DEFAULT_CODEC,
+        progress: Callable[[PakProgress], None] = None,
+    ):
+        # <name>.pak becomes an index next to <name>.001.pak, <name>.002.pak, ...
+        entries = self.pak_entries()
+        index_entries = [entry for entry in entries if entry.arcname in INDEX_ENTRIES]
+        volume_entries = [
+            entry
+            for entry in entries
+            if not entry.is_dir() and entry.arcname not in INDEX_ENTRIES
+        ]
+        path = Path(pak_name + ".pak")
+        return write_volumes(
+            path.parent,
+            path.stem,
+            index_entries,
+            volume_entries,
+            cap,
+            workers,
+            codec,
+            progress,
+        )
+
+    def pak_entries(self):
+        # the layout of a .pak, in the order pak_temp writes it; metadata.json
+        # may only be written just before packing
+        entries = []
+        if self.tree.has_metadata():
+            entries.append(PakEntry("metadata.json", self.tree.metadata()))
+        entries += self.cover_entries()
+        if self.tree.has_intro():
+            entries.append(PakEntry("intro.mp3", self.tree.intro()))
+        if self.tree.has_readme():
+            entries.append(PakEntry("README.md", self.tree.readme()))
+        entries += [PakEntry("tracks/"), PakEntry("sfx/"), PakEntry("interrupts/")]
+        entries += [
+            PakEntry(f"tracks/{track.name}", self.tree.resolve(track))
+            for track in self.tree.tracks()
+        ]
+        entries += [PakEntry(f"sfx/{sfx.name}", sfx) for sfx in self.tree.sfx()]
+        entries += [
+            PakEntry(f"interrupts/{interrupt.name}", self.tree.resolve(interrupt))
+            for interrupt in self.tree.interrupts()
+        ]
+        return entries
+
+    def cover_entries(self):
+        # normalized, cached renditions when Pillow is around, else the
+        # cover exactly as dropped in; like a transcode, the main rendition
+        # only replaces the original when it is smaller
+        if not self.tree.has_cover():
+            return []
+        cover = self.tree.cover()
+        stat = os.stat(cover)
+        key = (cover, stat.st_size, stat.st_mtime_ns)
+        if self._cover is None or self._cover[0] != key:
+            self._cover = (key, normalize(cover))
+        renditions = dict(self._cover[1])
+        main = renditions.pop(COVER_SIZES[0], None)
+        if main is None or os.path.getsize(main) >= stat.st_size:
+            entries = [PakEntry(f"cover{cover.suffix.lower()}", cover)]
+        else:
+            entries = [PakEntry(cover_name(COVER_SIZES[0], main.suffix), main)]
+        # thumbnails only exist when COVER_SIZES asks for them
+        return entries + [
+            PakEntry(cover_name(size, path.suffix), path) for size, path in renditions.items()
+        ]
+
+    def transcode(self, cap: int = PAK_SIZE_LIMIT, workers: int = None):
+        # re-encodes tracks and interrupts at the highest bitrate that brings
+        # the estimated pak under cap; returns (bitrate, reports), or
+        # (None, []) when the pak already fits
+        entries = self.pak_entries()
+        if estimate_pak_size(entries) <= cap:
+            return None, []
+        sources = {
+            f"{folder}/{path.name}": path
+            for folder, paths in (("tracks", self.tree.tracks()), ("interrupts", self.tree.interrupts()))
+            for path in paths
+            if path.suffix.lower() == ".mp3"
+        }
+        others = [entry for entry in entries if entry.arcname not in sources]
+        fixed = (
+            estimate_pak_size(others)
+            + estimate_overhead(entries)
+            - estimate_overhead(others)
+            + sum(estimate_entry_size(PakEntry(arcname)) for arcname in sources)
+        )
+        seconds = sum(duration(path) for path in sources.values())
+        bitrate = choose_bitrate(seconds, cap - fixed) or BITRATES[-1]
+        reports = transcode_all(list(sources.values()), bitrate, workers=workers)
+        for report in reports:
+            if not report.skipped:
+                self.tree.substitute(report.source, report.output)
+        return bitrate, reports
+
+    def known_encodings(self, entries: List[PakEntry], codec: str = DEFAULT_CODEC) -> Tuple[Set[str], Dict[str, int]]:
+        # what the index knows without reading a file: the arcnames whose
+        # content an earlier entry has (a dedup pack aliases them), and
+        # arcname -> payload size the last pack with codec got for the content
+        duplicates, sizes = set(), {}
+        if self.index is None:
+            return duplicates, sizes
+        codec = DEFAULT_CODEC if codec == AUTO_CODEC else codec
+        seen = set()
+        for entry in entries:
+            if entry.is_dir():
+                continue
+            known = self.index.lookup(entry.path)
+            if known is None or known.hash is None or known.size == 0:
+                continue
+            if known.hash in seen:
+                duplicates.add(entry.arcname)
+            seen.add(known.hash)
+            encoding = self.index.encoding(known.hash, codec)
+            if encoding is not None:
+                sizes[entry.arcname] = encoding[1]
+        return duplicates, sizes
+
+    def estimate_pak_size(self, codec: str = DEFAULT_CODEC, dedup: bool = False):
+        entries = self.pak_entries()
+        duplicates, sizes = self.known_encodings(entries, codec)
+        return estimate_pak_size(
+            entries, codec=codec, duplicates=duplicates if dedup else (), known=sizes
+        )
+
+    def plan_prune(self, cap: int = PAK_SIZE_LIMIT) -> PrunePlan:
+        # the cheapest set of files to prune so the estimated pak fits in cap;
+        # metadata.json is never a candidate
+        entries = self.pak_entries()
+        targets = {
+            f"{folder}/{path.name}": (folder, path)
+            for folder, paths in (
+                ("tracks", self.tree.tracks()),
+                ("sfx", self.tree.sfx()),
+                ("interrupts", self.tree.interrupts()),
+            )
+            for path in paths
+        }
+        if self.tree.has_intro():
+            targets["intro.mp3"] = ("intro", self.tree.intro())
+        if self.tree.has_readme():
+            targets["README.md"] = ("README", self.tree.readme())
+        try:
+            priorities = metadata_priorities(self.tree.metadata(as_dict=True))
+        except (OSError, ValueError):
+            priorities = {}
+        items: Dict[Path, PruneItem] = {}
+        overhead = estimate_overhead(entries)
+        for entry in entries:
+            size = estimate_entry_size(entry)
+            if entry.arcname in targets:
+                kind, path = targets[entry.arcname]
+            elif entry.arcname.startswith("cover") and self.tree.has_cover():
+                kind, path = "cover", self.tree.cover()  # every rendition goes with it
+            else:
+                overhead += size
+                continue
+            if path not in items:
+                priority = priorities.get(path.name, KIND_PRIORITY[kind])
+                items[path] = PruneItem(path, kind, 0, priority)
+            items[path].size += size
+        return plan_prune(list(items.values()), cap, overhead)
+
+    def apply_plan(self, plan: PrunePlan):
+        for item in plan.removals:
+            self.tree.prune(item.path)
+
+    def validate_audio(self, workers: int = None) -> List[str]:
+        # the deep MP3 frame scan over what is mounted, pruned files left
+        # out; one message per audio file that failed it
+        validator = RootDirectoryValidator(self.tree.root(), verbose=False, workers=workers, index=self.index)
+        inventory = validator.scan()
+        included = set(self.tree.list_files())
+        inventory.items = [item for item in inventory.items if item.path in included]
+        inventory.rejections = []
+        validator.probe(inventory)
+        return inventory.rejections
 
     def is_file_empty(path: Path):
         return path.exists() and path.stat().st_size == 0
@@ -367,7 +899,7 @@ class FileHandler:
     def is_dir_empty(path: Path):
         return path.exists() and not any(path.iterdir())
 
-    def file_size_mb(path: Path):
-        size_bytes = os.path.getsize(path)
+    def file_size_mb(self, path: Path):
+        size_bytes = self.tree.size(path)
         size_mb = size_bytes / (1024 * 1024)
         return size_mb
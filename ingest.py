@@ -0,0 +1,226 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import json
+import os
+import random
+import sqlite3
+import threading
+
+# everything nerapak keeps between runs: this index, transcodes, covers
+CACHE_ROOT = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "nerapak"
+INDEX_PATH = CACHE_ROOT / "ingest.sqlite3"
+INDEX_VERSION = 1
+# rows whose file is checked for existence each time the index is opened
+EVICT_BATCH = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    duration REAL,
+    bitrate INTEGER,
+    verdict TEXT,
+    probe TEXT
+);
+CREATE TABLE IF NOT EXISTS encodings (
+    hash TEXT NOT NULL,
+    codec TEXT NOT NULL,
+    method INTEGER NOT NULL,
+    compress_size INTEGER NOT NULL,
+    PRIMARY KEY (hash, codec)
+);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+"""
+FIELDS = ("hash", "duration", "bitrate", "verdict", "probe")
+# what verdict holds for a file that passed deep validation
+VERDICT_OK = "ok"
+
+
+@dataclass
+class IndexEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    hash: Optional[str] = None
+    duration: Optional[float] = None  # seconds
+    bitrate: Optional[int] = None  # kbps
+    verdict: Optional[str] = None  # VERDICT_OK or the probe's error
+    probe: Optional[dict] = None  # ProbeReport.to_dict() of the last deep scan
+
+
+class IngestIndex:
+    """
+    What earlier imports learned about a file, keyed by (path, size, mtime):
+    content hash, duration, bitrate and deep-validation verdict, plus the
+    compressed size of each content hash per codec. A row whose size or
+    mtime no longer matches the file is stale and dropped on the next write.
+    A row whose file is gone is evicted when a lookup misses it, and every
+    open checks another EVICT_BATCH rows, so files never asked for again
+    still age out without a walk over the whole history.
+    Paths under an ignored root, such as a session's workspace, are never
+    recorded.
+
+    One connection is shared by the threads of a process; processes share
+    the database through WAL.
+    """
+
+    def __init__(self, path: Path = INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._ignored: Set[Path] = set()
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                self._db.executescript(
+                    "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS encodings;"
+                )
+                self._db.execute(f"PRAGMA user_version={INDEX_VERSION}")
+            self._db.executescript(SCHEMA)
+        self.evict()
+        return
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def ignore(self, root: Path):
+        # files under root are throwaway copies; they are never recorded
+        with self._lock:
+            self._ignored.add(Path(root))
+
+    def evict(self, limit: int = EVICT_BATCH) -> int:
+        # checks up to limit rows, from a random point onwards, and drops
+        # those whose file is gone; returns how many were dropped
+        with self._lock:
+            last = self._db.execute("SELECT MAX(rowid) FROM files").fetchone()[0]
+            if last is None:
+                return 0
+            start = random.randint(1, last)
+            paths = [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT path FROM files WHERE rowid >= ? ORDER BY rowid LIMIT ?", (start, limit)
+                )
+            ]
+        gone = [path for path in paths if not os.path.exists(path)]
+        self._forget(gone)
+        return len(gone)
+
+    def _forget(self, paths: List[str]):
+        # drops the rows of paths, then the encodings of contents no
+        # remaining file has
+        if not paths:
+            return
+        with self._lock, self._db:
+            hashes = set()
+            for path in paths:
+                row = self._db.execute("SELECT hash FROM files WHERE path = ?", (path,)).fetchone()
+                if row is None:
+                    continue
+                self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+                if row[0] is not None:
+                    hashes.add(row[0])
+            for digest in hashes:
+                self._db.execute(
+                    "DELETE FROM encodings WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM files WHERE hash = ?)",
+                    (digest, digest),
+                )
+
+    def lookup(self, path: Path, stat: os.stat_result = None) -> Optional[IndexEntry]:
+        # the row for path if it still describes the file on disk
+        path = Path(path)
+        try:
+            stat = stat if stat is not None else os.stat(path)
+        except OSError:
+            self._forget([str(path)])
+            return None
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT path, size, mtime_ns, {', '.join(FIELDS)} FROM files WHERE path = ?",
+                (str(path),),
+            ).fetchone()
+        if row is None or row[1] != stat.st_size or row[2] != stat.st_mtime_ns:
+            return None
+        entry = IndexEntry(*row)
+        entry.probe = json.loads(entry.probe) if entry.probe else None
+        return entry
+
+    def record(self, path: Path, stat: os.stat_result = None, **fields):
+        self.record_many([(path, stat, fields)])
+
+    def record_many(self, rows: Iterable[Tuple[Path, os.stat_result, Dict]]):
+        # (path, stat or None, {field: value}) in one transaction; a stale
+        # row is replaced, a current one only gets the given fields updated
+        rows = list(rows)
+        unknown = {name for _, _, fields in rows for name in fields} - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown index fields: {', '.join(sorted(unknown))}")
+        prepared = []
+        with self._lock:
+            ignored = list(self._ignored)
+        for path, stat, fields in rows:
+            if any(Path(path).is_relative_to(root) for root in ignored):
+                continue
+            try:
+                stat = stat if stat is not None else os.stat(path)
+            except OSError:
+                continue
+            if fields.get("probe") is not None:
+                fields = {**fields, "probe": json.dumps(fields["probe"])}
+            prepared.append((str(path), stat.st_size, stat.st_mtime_ns, fields))
+        with self._lock, self._db:
+            for path, size, mtime_ns, fields in prepared:
+                self._db.execute(
+                    "DELETE FROM files WHERE path = ? AND (size != ? OR mtime_ns != ?)",
+                    (path, size, mtime_ns),
+                )
+                self._db.execute(
+                    "INSERT OR IGNORE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                    (path, size, mtime_ns),
+                )
+                if fields:
+                    self._db.execute(
+                        f"UPDATE files SET {', '.join(f'{name} = ?' for name in fields)} WHERE path = ?",
+                        (*fields.values(), path),
+                    )
+
+    def encoding(self, digest: str, codec: str) -> Optional[Tuple[int, int]]:
+        # (method, compress_size) the last pack got for this content and codec
+        with self._lock:
+            return self._db.execute(
+                "SELECT method, compress_size FROM encodings WHERE hash = ? AND codec = ?",
+                (digest, codec),
+            ).fetchone()
+
+    def record_encodings(self, rows: Iterable[Tuple[str, str, int, int]]):
+        # (hash, codec, method, compress_size)
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO encodings (hash, codec, method, compress_size) VALUES (?, ?, ?, ?)",
+                list(rows),
+            )
+
+
+_index: Optional[IngestIndex] = None
+_index_pid: int = None
+_index_lock = threading.Lock()
+
+
+def default_index() -> Optional[IngestIndex]:
+    # the per-process index at INDEX_PATH; None when it cannot be opened, in
+    # which case everything is simply worked out from scratch
+    global _index, _index_pid
+    with _index_lock:
+        if _index_pid != os.getpid():
+            try:
+                _index = IngestIndex()
+            except (OSError, sqlite3.Error):
+                _index = None
+            _index_pid = os.getpid()
+        return _index
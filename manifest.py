@@ -0,0 +1,123 @@
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import Dict, Tuple
+import hashlib
+import json
+from atomic import write_bytes
+
+MANIFEST_VERSION = 1
+# written inside the pak itself, next to metadata.json
+PAK_MANIFEST_NAME = "manifest.json"
+HASH_SIZE = 32
+CHUNK_SIZE = 1024 * 1024
+
+
+def new_hash():
+    return hashlib.blake2b(digest_size=HASH_SIZE)
+
+
+def hash_file(path: Path) -> str:
+    digest = new_hash()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sidecar_path(pak_path: Path) -> Path:
+    pak_path = Path(pak_path)
+    return pak_path.with_name(pak_path.name + ".manifest.json")
+
+
+@dataclass
+class ManifestEntry:
+    arcname: str
+    path: str
+    size: int
+    mtime_ns: int
+    hash: str
+    method: int
+    crc: int
+    compress_size: int
+    offset: int
+    alias_of: str = None
+
+
+class PakManifest:
+    def __init__(
+        self,
+        entries: Dict[str, ManifestEntry] = None,
+        aliases: Dict[str, str] = None,
+        checksums: Dict[str, Tuple[int, str]] = None,
+        codec: str = None,
+    ):
+        self.entries: Dict[str, ManifestEntry] = entries if entries is not None else {}
+        self.aliases: Dict[str, str] = aliases if aliases is not None else {}
+        # arcname -> (size, BLAKE2 digest), what readers verify members against
+        self.checksums: Dict[str, Tuple[int, str]] = checksums if checksums is not None else {}
+        self.codec = codec
+        return
+
+    def add(self, entry: ManifestEntry):
+        self.entries[entry.arcname] = entry
+        self.checksums[entry.arcname] = (entry.size, entry.hash)
+        if entry.alias_of is not None:
+            self.aliases[entry.arcname] = entry.alias_of
+
+    def get(self, arcname: str) -> ManifestEntry:
+        return self.entries.get(arcname)
+
+    def resolve(self, arcname: str) -> str:
+        # aliases always point at a stored member, never at another alias
+        return self.aliases.get(arcname, arcname)
+
+    def to_dict(self):
+        return {
+            "version": MANIFEST_VERSION,
+            "codec": self.codec,
+            "entries": [asdict(entry) for entry in self.entries.values()],
+        }
+
+    def to_member(self) -> bytes:
+        return json.dumps(
+            {
+                "version": MANIFEST_VERSION,
+                "hash": f"blake2b-{HASH_SIZE * 8}",
+                "codec": self.codec,
+                "aliases": self.aliases,
+                "entries": {
+                    arcname: {"size": size, "hash": digest}
+                    for arcname, (size, digest) in self.checksums.items()
+                },
+            },
+            indent=2,
+        ).encode("utf-8")
+
+    def from_member(data: bytes) -> "PakManifest":
+        parsed = json.loads(data)
+        return PakManifest(
+            aliases=parsed.get("aliases", {}),
+            codec=parsed.get("codec"),
+            checksums={
+                arcname: (entry["size"], entry["hash"])
+                for arcname, entry in parsed.get("entries", {}).items()
+            },
+        )
+
+    def save(self, path: Path):
+        write_bytes(path, json.dumps(self.to_dict(), indent=2).encode("utf-8"))
+
+    def load(path: Path) -> "PakManifest":
+        path = Path(path)
+        if not path.is_file():
+            return None
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        manifest = PakManifest(codec=data.get("codec"))
+        for entry in data["entries"]:
+            manifest.add(ManifestEntry(**entry))
+        return manifest
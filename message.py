@@ -33,6 +33,9 @@ messages = {
     "default_mode_prompt": """🛠️  Type any of the following commands: \n
     [play] → play and preview tracks \n
     [pack] → package into .pak format \n
+    [split] → package into several .pak volumes under the size limit \n
+    [transcode] → re-encode tracks and interrupts to fit the size limit \n
+    [validate] → scan every audio file for broken MP3 frames \n
     [upload] → upload to Neraverse \n
     [new] → start over with a new folder \n \n
     [prune] → remove files from the folder \n \n
@@ -52,6 +55,8 @@ messages = {
     ↑ [up]           select previous file \n
     ↓ [down]         select next file \n
     [delete]       delete selected file \n
+    [plan]         work out the fewest, least valued files to drop to fit the size limit \n
+    [apply]        prune every file in the plan at once \n
     [q]         exit pruning mode \n
     """,
 }
@@ -6,8 +6,11 @@ from typing import TYPE_CHECKING, List
 from schemas import Mode
 from pynput import keyboard
 from datetime import datetime
+import threading
 import utils
-from files import FileHandler, TempTree
+from pak import PakProgress
+from planner import PrunePlan
+from simple_renderer import Engine
 from pathlib import Path
 
 if TYPE_CHECKING:
@@ -52,8 +55,24 @@ class DefaultMode(ModeHandler):
     def __init__(self, session: "Session"):
         super().__init__(session)
         self.enabled = False
+        self.split = False
+        self.packing = False
+        self._bar: utils.ProgressBar = None
+        # the auditioned pak last unpacked into the workspace
+        self._unpacked: Path = None
+        session.events.on(SessionEvents.pak_progress, self._on_pak_progress)
         return
 
+    def _unpack_auditioned(self):
+        # a pak dropped for playback is only extracted once it is pruned or
+        # repacked, and only once per pak
+        pak = self.session.audio_manager.pak
+        if pak is None or self._unpacked == pak.path:
+            return
+        self.session.io.write(f"Unpacking {pak.path.name}...", OutputType.text)
+        self.session.file_handler.unpack(pak.path)
+        self._unpacked = pak.path
+
     def handle_pak_selected(self, response: str):
         self.session.state.pak_name = response
         self.session.io.write("What is the description of your pak?", OutputType.question, self.handle_pak_description_selected)
@@ -64,21 +83,93 @@ class DefaultMode(ModeHandler):
 
     def handle_pak_author_selected(self, response: str):
         self.session.state.pak_author = response
-        TempTree.write_metadata({
+        self.session.temptree.write_metadata({
             "title": self.session.state.pak_name,
             "description": self.session.state.pak_description,
             "author": self.session.state.pak_author,
             "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         })
-        self.session.io.write("Packing...", OutputType.text)
-        spinner = utils.BarSpinner("")
-        spinner.start(self.session.file_handler.pak_temp)
+        # packing runs off the io thread so the prompt loop keeps ticking;
+        # not a daemon, so exiting mid-pack still finishes the atomic write
+        self.packing = True
+        self._bar = utils.ProgressBar("Packing ")
+        threading.Thread(
+            target=self._pack, args=(self.session.state.pak_name, self.split)
+        ).start()
+
+    def _publish_progress(self, progress: PakProgress):
+        self.session.events.emit(SessionEvents.pak_progress, progress)
+
+    def _on_pak_progress(self, progress: PakProgress):
+        if self._bar is None:
+            return
+        self._bar.update(
+            progress.bytes_read, progress.bytes_total, progress.throughput(), progress.eta()
+        )
+
+    def _pack(self, pak_name: str, split: bool):
+        try:
+            if split:
+                index, _ = self.session.file_handler.pak_split(pak_name, progress=self._publish_progress)
+            else:
+                self.session.file_handler.pak_temp(
+                    pak_name, incremental=True, progress=self._publish_progress
+                )
+        except Exception as e:
+            self._bar.finish()
+            self._bar = None
+            self.session.io.write(f"Packing failed: {e}", OutputType.error)
+            self.session.io.write(messages["default_mode_prompt"], OutputType.question)
+            return
+        finally:
+            self.packing = False
+        self._bar.finish()
+        self._bar = None
         self.session.io.clear()
         self.session.io.write("Done!", OutputType.text)
-        self.session.io.write("Pak saved to: " + self.session.state.pak_name + ".pak", OutputType.text)
+        self.session.io.write("Pak saved to: " + pak_name + ".pak", OutputType.text)
+        if split:
+            for volume in index["volumes"]:
+                self.session.io.write(f"├─ Volume: {volume['name']} ({volume['size']} bytes)", OutputType.text)
         self.session.io.clear()
         self.session.io.write(messages["default_mode_prompt"], OutputType.question)
 
+    def _transcode(self):
+        try:
+            bitrate, reports = self.session.file_handler.transcode()
+        except Exception as e:
+            self.session.io.write(f"Transcoding failed: {e}", OutputType.error)
+            self.session.io.write(messages["default_mode_prompt"], OutputType.question)
+            return
+        finally:
+            self.packing = False
+        size = self.session.file_handler.estimate_pak_size() / (1024 * 1024)
+        if bitrate is None:
+            self.session.io.write(f"Pak already fits ({size:.2f}MB), nothing to transcode", OutputType.text)
+        else:
+            encoded = [report for report in reports if not report.skipped]
+            cached = sum(1 for report in encoded if report.cached)
+            self.session.io.write(
+                f"Re-encoded {len(encoded)} files at {bitrate}kbps ({cached} from cache)", OutputType.text
+            )
+            self.session.io.write(f"Estimated pak size: {size:.2f}MB", OutputType.text)
+        self.session.io.write(messages["default_mode_prompt"], OutputType.question)
+
+    def _validate(self):
+        try:
+            problems = self.session.file_handler.validate_audio()
+        except Exception as e:
+            self.session.io.write(f"Validation failed: {e}", OutputType.error)
+            self.session.io.write(messages["default_mode_prompt"], OutputType.question)
+            return
+        finally:
+            self.packing = False
+        if not problems:
+            self.session.io.write("Every audio file decodes as MP3", OutputType.text)
+        for problem in problems:
+            self.session.io.write(problem, OutputType.error)
+        self.session.io.write(messages["default_mode_prompt"], OutputType.question)
+
     def on_response(self, data: str):
         if not self.enabled:
             return
@@ -90,7 +181,22 @@ class DefaultMode(ModeHandler):
         if data == "upload":
             # do uploading
             pass
-        elif data == "pack":
+        elif data == "transcode" and not self.packing:
+            self._unpack_auditioned()
+            self.packing = True
+            self.session.io.write("Transcoding...", OutputType.text)
+            threading.Thread(target=self._transcode).start()
+        elif data == "validate" and not self.packing:
+            # the frame scan reads every track, so it only runs when asked for
+            self._unpack_auditioned()
+            self.packing = True
+            self.session.io.write("Scanning audio...", OutputType.text)
+            threading.Thread(target=self._validate).start()
+        elif data in ("pack", "split", "transcode", "validate") and self.packing:
+            self.session.io.write("A pak is still being packed", OutputType.error)
+        elif data == "pack" or data == "split":
+            self._unpack_auditioned()
+            self.split = data == "split"
             self.session.io.clear()
             self.session.io.write("What is the name of your pak?", OutputType.question, self.handle_pak_selected)
             # do packing
@@ -99,6 +205,7 @@ class DefaultMode(ModeHandler):
             # do new drag and drop
             pass
         elif data == "prune":
+            self._unpack_auditioned()
             self.session.mode_manager.switch_mode(Mode.PRUNING)
         elif data == "menu":
             # TODO: !!! implement menu !!!
@@ -218,8 +325,9 @@ class PruningMode(ModeHandler):
     def __init__(self, session: "Session"):
         super().__init__(session)
         self.enabled = False
-        self.files: List[Path] = TempTree.list_files()
+        self.files: List[Path] = self.session.temptree.list_files()
         self.selection_index: int = 0
+        self.plan: PrunePlan = None
         return
 
     def draw_table(self):
@@ -227,7 +335,7 @@ class PruningMode(ModeHandler):
             "Pruning Mode",
             ["File", "Size"],
             [
-                [file.name, FileHandler.file_size_mb(file)]
+                [file.name, self.session.file_handler.file_size_mb(file)]
                 for file in self.files
             ],
             self.selection_index,
@@ -238,16 +346,44 @@ class PruningMode(ModeHandler):
         self.write_prompt()
 
         self.session.sys_messenger.write_line(
-            f" > Current selection: {self.files[self.selection_index].name} | File size: {FileHandler.file_size_mb(self.files[self.selection_index])} MB "
+            f" > Current selection: {self.files[self.selection_index].name} | File size: {self.session.file_handler.file_size_mb(self.files[self.selection_index])} MB "
+            f"| Total: {utils.format_bytes(self.session.temptree.total_size())} "
+        )
+        return
+
+    def draw_plan(self):
+        table = utils.NTable(
+            "Prune Plan",
+            ["File", "Kind", "Size", "Priority"],
+            [
+                [item.path.name, item.kind, utils.format_bytes(item.size), f"{item.priority:g}"]
+                for item in self.plan.removals
+            ],
+        )
+        self.session.sys_messenger.clear()
+        table.display()
+        print("\n")
+        self.write_prompt()
+        self.session.sys_messenger.write_line(
+            f" > Plan: remove {len(self.plan.removals)} files, freeing {utils.format_bytes(self.plan.freed())} "
+            f"| Estimated pak: {utils.format_bytes(self.plan.total)} -> {utils.format_bytes(self.plan.projected())} "
+            f"| Solved in {self.plan.seconds * 1000:.1f}ms "
         )
         return
 
     def write_prompt(self):
-        self.session.io.write(messages["pruning_mode_prompt"], OutputType.selection, data=["up", "down", "delete", "q"])
+        self.session.io.write(
+            messages["pruning_mode_prompt"],
+            OutputType.selection,
+            data=["up", "down", "delete", "plan", "apply", "q"],
+        )
 
     def enable(self):
         print("=================================== PRUNING MODE ===================================")
         self.enabled = True
+        self.files = self.session.temptree.list_files()
+        self.selection_index = 0
+        self.plan = None
         self.session.io.clear()
         self.write_prompt()
         self.session.events.emit(SessionEvents.default_mode_started)
@@ -275,7 +411,44 @@ class PruningMode(ModeHandler):
             self.draw_table()
             return
         if response == "delete":
-            self.files[self.selection_index].unlink()
+            if not self.files:
+                return
+            self.session.temptree.prune(self.files.pop(self.selection_index))
+            Engine.set_context({"pak_bytes": self.session.temptree.total_size()})
+            self.plan = None
+            self.selection_index = max(0, min(self.selection_index, len(self.files) - 1))
+            if not self.files:
+                self.write_prompt()
+                return
+            self.draw_table()
+            return
+        if response == "plan":
+            try:
+                self.plan = self.session.file_handler.plan_prune()
+            except (OSError, ValueError) as e:
+                self.session.io.write(f"No plan: {e}", OutputType.error)
+                self.write_prompt()
+                return
+            if not self.plan.removals:
+                self.session.io.write("Pak already fits, nothing to prune", OutputType.text)
+                self.write_prompt()
+                return
+            self.draw_plan()
+            return
+        if response == "apply":
+            if self.plan is None or not self.plan.removals:
+                self.session.io.write("No plan to apply, type [plan] first", OutputType.error)
+                self.write_prompt()
+                return
+            # one batch: every removal in the plan, then a single refresh
+            self.session.file_handler.apply_plan(self.plan)
+            self.plan = None
+            Engine.set_context({"pak_bytes": self.session.temptree.total_size()})
+            self.files = self.session.temptree.list_files()
+            self.selection_index = 0
+            if not self.files:
+                self.write_prompt()
+                return
             self.draw_table()
             return
         else:
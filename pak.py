@@ -0,0 +1,1026 @@
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+import io
+import mmap
+import os
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from atomic import WRITE_BUFFER, AtomicFile
+from compression import (
+    AUTO_CODEC,
+    AUTO_TOLERANCE,
+    DEFAULT_CODEC,
+    PRECOMPRESSED_EXTENSIONS,
+    CodecBenchmark,
+    CompressionPolicy,
+    EntryReport,
+    auto_codec,
+    decompressor,
+    get_codec,
+)
+from ingest import IngestIndex
+from manifest import (
+    CHUNK_SIZE,
+    PAK_MANIFEST_NAME,
+    ManifestEntry,
+    PakManifest,
+    new_hash,
+    sidecar_path,
+)
+
+# compressed bytes fed to a decompressor per step, which bounds its output
+DECOMPRESS_SIZE = 64 * 1024
+# seconds between progress callbacks while packing
+PROGRESS_INTERVAL = 0.1
+# encoded payloads allowed in flight per worker, which bounds what the
+# parent holds in memory however large the folder is
+ENCODE_WINDOW = 2
+
+
+@dataclass
+class PakEntry:
+    arcname: str
+    path: Optional[Path] = None  # None for directory entries
+
+    def is_dir(self):
+        return self.path is None
+
+
+@dataclass
+class PakProgress:
+    bytes_total: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    entries_total: int = 0
+    entries_done: int = 0
+    elapsed: float = 0.0
+    done: bool = False
+
+    def throughput(self) -> float:
+        # source bytes per second
+        return self.bytes_read / self.elapsed if self.elapsed > 0 else 0.0
+
+    def eta(self) -> Optional[float]:
+        rate = self.throughput()
+        if self.done:
+            return 0.0
+        if rate <= 0:
+            return None
+        return (self.bytes_total - self.bytes_read) / rate
+
+
+@dataclass
+class EncodedEntry:
+    method: int
+    crc: int
+    file_size: int
+    data: bytes
+    digest: str
+    cpu_seconds: float = 0.0
+
+
+def ingest_file(
+    path: Path,
+    codec: str = DEFAULT_CODEC,
+    policy: CompressionPolicy = None,
+) -> EncodedEntry:
+    # the only read of a source file: size, crc, BLAKE2 digest, the
+    # store/compress probe and the payload all come out of this one pass
+    started = time.process_time()
+    policy = policy if policy is not None else CompressionPolicy()
+    codec = get_codec(codec)
+    suffix = Path(path).suffix
+    method = None
+    compressor = None
+    digest = new_hash()
+    crc = 0
+    size = 0
+    chunks = []
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            if method is None:
+                method = zipfile.ZIP_STORED
+                if policy.choose_sample(suffix, chunk) != zipfile.ZIP_STORED:
+                    method = codec.method
+                    compressor = codec.compressor()
+            crc = zlib.crc32(chunk, crc)
+            digest.update(chunk)
+            size += len(chunk)
+            chunks.append(compressor.compress(chunk) if compressor else chunk)
+    if compressor is not None:
+        chunks.append(compressor.flush())
+    return EncodedEntry(
+        method if method is not None else zipfile.ZIP_STORED,
+        crc,
+        size,
+        b"".join(chunks),
+        digest.hexdigest(),
+        time.process_time() - started,
+    )
+
+
+def encode_name(zinfo: zipfile.ZipInfo):
+    try:
+        return zinfo.filename.encode("ascii"), zinfo.flag_bits
+    except UnicodeEncodeError:
+        return zinfo.filename.encode("utf-8"), zinfo.flag_bits | 0x800
+
+
+def central_directory_record(zinfo: zipfile.ZipInfo) -> bytes:
+    if zinfo.header_offset > zipfile.ZIP64_LIMIT:
+        raise zipfile.LargeZipFile("Pak offset would require ZIP64 extensions")
+    filename, flag_bits = encode_name(zinfo)
+    dosdate = (zinfo.date_time[0] - 1980) << 9 | zinfo.date_time[1] << 5 | zinfo.date_time[2]
+    dostime = zinfo.date_time[3] << 11 | zinfo.date_time[4] << 5 | (zinfo.date_time[5] // 2)
+    header = struct.pack(
+        zipfile.structCentralDir,
+        zipfile.stringCentralDir,
+        zinfo.create_version,
+        zinfo.create_system,
+        zinfo.extract_version,
+        zinfo.reserved,
+        flag_bits,
+        zinfo.compress_type,
+        dostime,
+        dosdate,
+        zinfo.CRC,
+        zinfo.compress_size,
+        zinfo.file_size,
+        len(filename),
+        len(zinfo.extra),
+        len(zinfo.comment),
+        0,
+        zinfo.internal_attr,
+        zinfo.external_attr,
+        zinfo.header_offset,
+    )
+    return header + filename + zinfo.extra + zinfo.comment
+
+
+def end_of_central_directory(count: int, size: int, offset: int) -> bytes:
+    if count > zipfile.ZIP_FILECOUNT_LIMIT or offset > zipfile.ZIP64_LIMIT:
+        raise zipfile.LargeZipFile("Pak would require ZIP64 extensions")
+    return struct.pack(
+        zipfile.structEndArchive,
+        zipfile.stringEndArchive,
+        0,
+        0,
+        count,
+        count,
+        size,
+        offset,
+        0,
+    )
+
+
+class PakWriter:
+    """
+    Builds a .pak (plain zip). Every file is read exactly once: files in an
+    already compressed format are streamed from their source straight into
+    the archive, their first chunk deciding whether they are stored, and the
+    rest go through ingest_file in a process pool, with at most
+    ENCODE_WINDOW payloads per worker in flight, and are spliced in in
+    insertion order.
+
+    With incremental=True, members whose source is unchanged since the last
+    pack (per the sidecar manifest) are copied raw from the previous archive.
+    Only incremental packs keep a sidecar; it records source paths relative
+    to root, or the arcname for members from elsewhere.
+    With dedup=True, a file whose digest matches an earlier member is not
+    stored again and is recorded as an alias in the pak's own manifest.json,
+    which also carries every member's size and BLAKE2 digest. Aliases are
+    invisible to plain zip readers, which only see the central directory,
+    so dedup is opt-in for paks that are only ever read through PakReader.
+
+    The archive is written through an AtomicFile, so an interrupted pack never
+    leaves a truncated .pak behind; preallocate=True reserves the expected
+    size up front.
+
+    codec names an entry of compression.CODECS for the members the policy
+    does not store; "auto" benchmarks them all on a sample of this pak's own
+    files and picks the fastest within tolerance of the best ratio. The
+    choice is recorded in manifest.json.
+
+    progress, if given, is called with a PakProgress at most every
+    progress_interval seconds and once more when the pak is complete.
+
+    index, if given, supplies the content hashes of files unchanged since an
+    earlier import, so duplicates are aliased without being read, and learns
+    every member's hash and compressed size once the pak is written.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        workers: int = None,
+        codec: str = DEFAULT_CODEC,
+        tolerance: float = AUTO_TOLERANCE,
+        policy: CompressionPolicy = None,
+        incremental: bool = False,
+        dedup: bool = False,
+        buffering: int = WRITE_BUFFER,
+        preallocate: bool = False,
+        progress: Callable[[PakProgress], None] = None,
+        progress_interval: float = PROGRESS_INTERVAL,
+        index: IngestIndex = None,
+        root: Path = None,
+    ):
+        self.path = Path(path)
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        if codec != AUTO_CODEC:
+            get_codec(codec)
+        self.codec = codec
+        self.tolerance = tolerance
+        self.benchmarks: List[CodecBenchmark] = []
+        self.policy = policy if policy is not None else CompressionPolicy()
+        self.incremental = incremental
+        self.dedup = dedup
+        self.buffering = buffering
+        self.preallocate = preallocate
+        self.entries: List[PakEntry] = []
+        self.report: List[EntryReport] = []
+        self.manifest = PakManifest()
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.index = index
+        self.root = Path(root) if root is not None else None
+        self._progress = PakProgress()
+        self._started = 0.0
+        self._reported = 0.0
+        self._closed = False
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False
+
+    def add(self, entry: PakEntry):
+        self.entries.append(entry)
+
+    def write(self, path: Path, arcname: str):
+        self.entries.append(PakEntry(arcname, Path(path)))
+
+    def mkdir(self, arcname: str):
+        self.entries.append(PakEntry(arcname.rstrip("/") + "/"))
+
+    def _encode(self, files: List[PakEntry]) -> Iterator[EncodedEntry]:
+        if self.workers <= 1 or len(files) <= 1:
+            for entry in files:
+                yield ingest_file(entry.path, self.codec, self.policy)
+            return
+        workers = min(self.workers, len(files))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for entry in files:
+                pending.append(pool.submit(ingest_file, entry.path, self.codec, self.policy))
+                if len(pending) >= workers * ENCODE_WINDOW:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _stream(
+        self, fp: BinaryIO, entry: PakEntry, stat: os.stat_result
+    ) -> Tuple[zipfile.ZipInfo, str, float]:
+        # a member goes from its source into the pak chunk by chunk; the
+        # first chunk decides stored or compressed, as in ingest_file, and
+        # the CRC and compressed size are patched into the local header once
+        # the data is through
+        started = time.process_time()
+        codec = get_codec(self.codec)
+        zinfo = zipfile.ZipInfo.from_file(entry.path, entry.arcname)
+        zinfo.compress_type = zipfile.ZIP_STORED
+        zinfo.file_size = stat.st_size
+        zinfo.compress_size = stat.st_size
+        zinfo.CRC = 0
+        compressor = None
+        digest = new_hash()
+        crc = 0
+        size = 0
+        packed = 0
+        with open(entry.path, "rb") as f:
+            chunk = f.read(CHUNK_SIZE)
+            if (
+                chunk
+                and codec.method != zipfile.ZIP_STORED
+                and self.policy.choose_sample(entry.path.suffix, chunk) != zipfile.ZIP_STORED
+            ):
+                zinfo.compress_type = codec.method
+                compressor = codec.compressor()
+                if codec.method == zipfile.ZIP_LZMA:
+                    zinfo.flag_bits |= 0x02  # end-of-stream marker, as zipfile sets it
+            self._splice(fp, zinfo)
+            while chunk:
+                crc = zlib.crc32(chunk, crc)
+                digest.update(chunk)
+                size += len(chunk)
+                data = compressor.compress(chunk) if compressor is not None else chunk
+                fp.write(data)
+                packed += len(data)
+                # throttled by _advance, so a long track shows progress too
+                self._advance(fp, len(chunk), partial=True)
+                chunk = f.read(CHUNK_SIZE)
+        if compressor is not None:
+            data = compressor.flush()
+            fp.write(data)
+            packed += len(data)
+        if size != stat.st_size:
+            raise OSError(f"{entry.path} changed size while it was being packed")
+        zinfo.CRC = crc
+        zinfo.compress_size = packed
+        end = fp.tell()
+        fp.seek(zinfo.header_offset)
+        fp.write(zinfo.FileHeader(False))
+        fp.seek(end)
+        return zinfo, digest.hexdigest(), time.process_time() - started
+
+    def _splice(self, fp: BinaryIO, zinfo: zipfile.ZipInfo, data: bytes = b""):
+        zinfo.header_offset = fp.tell()
+        fp.write(zinfo.FileHeader(False))
+        fp.write(data)
+
+    def _copy_member(self, fp: BinaryIO, source: BinaryIO, zinfo: zipfile.ZipInfo):
+        # local header + name + extra + payload, byte-for-byte from the old pak
+        source.seek(zinfo.header_offset)
+        fields = struct.unpack(zipfile.structFileHeader, source.read(zipfile.sizeFileHeader))
+        remaining = fields[10] + fields[11] + zinfo.compress_size
+        zinfo.header_offset = fp.tell()
+        fp.write(struct.pack(zipfile.structFileHeader, *fields))
+        while remaining > 0:
+            chunk = source.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated member {zinfo.filename}")
+            fp.write(chunk)
+            remaining -= len(chunk)
+
+    def _dir_info(self, entry: PakEntry) -> zipfile.ZipInfo:
+        zinfo = zipfile.ZipInfo(entry.arcname, time.localtime(time.time())[:6])
+        zinfo.external_attr = (0o40775 << 16) | 0x10
+        zinfo.compress_size = 0
+        zinfo.file_size = 0
+        zinfo.CRC = 0
+        return zinfo
+
+    def _member_info(self, arcname: str, data: bytes):
+        zinfo = zipfile.ZipInfo(arcname, time.localtime(time.time())[:6])
+        # always deflate, so any zip reader can find out what codec the rest uses
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0o600 << 16
+        packed = get_codec(DEFAULT_CODEC).compress(data)
+        zinfo.file_size = len(data)
+        zinfo.compress_size = len(packed)
+        zinfo.CRC = zlib.crc32(data)
+        return zinfo, packed
+
+    def _previous(self):
+        if not self.incremental or not self.path.is_file():
+            return None
+        manifest = PakManifest.load(sidecar_path(self.path))
+        if manifest is None or manifest.codec != self.codec:
+            return None
+        try:
+            with zipfile.ZipFile(self.path) as pak:
+                infos = {zinfo.filename: zinfo for zinfo in pak.infolist()}
+        except zipfile.BadZipFile:
+            return None
+        return manifest, infos
+
+    def _settled_codec(self, stats: Dict[int, os.stat_result]) -> str:
+        # an incremental repack of exactly the files "auto" last chose for
+        # keeps that choice instead of benchmarking them all over again
+        if not self.incremental:
+            return AUTO_CODEC
+        manifest = PakManifest.load(sidecar_path(self.path))
+        files = [entry for entry in self.entries if not entry.is_dir()]
+        if manifest is None or manifest.codec is None or len(manifest.entries) != len(files):
+            return AUTO_CODEC
+        for entry in files:
+            old = manifest.get(entry.arcname)
+            stat = stats[id(entry)]
+            if old is None or old.size != stat.st_size or old.mtime_ns != stat.st_mtime_ns:
+                return AUTO_CODEC
+        return manifest.codec
+
+    def _expected_size(self, stats: Dict[int, os.stat_result]) -> int:
+        # upper bound: payloads are never larger than their source, plus the
+        # local header and central record of every entry and the manifest
+        size = zipfile.sizeEndCentDir
+        for entry in self.entries + [PakEntry(PAK_MANIFEST_NAME)]:
+            name = len(entry.arcname.encode("utf-8"))
+            size += zipfile.sizeFileHeader + zipfile.sizeCentralDir + 2 * name
+            size += 160  # manifest.json line for this entry
+            if id(entry) in stats:
+                size += stats[id(entry)].st_size
+        return size
+
+    def _advance(self, fp: BinaryIO, size: int = 0, final: bool = False, partial: bool = False):
+        # partial: size bytes of an entry still being written
+        state = self._progress
+        state.bytes_read += size
+        state.entries_done += 1 if not final and not partial else 0
+        if self.progress is None:
+            return
+        now = time.perf_counter()
+        if not final and now - self._reported < self.progress_interval:
+            return
+        self._reported = now
+        state.bytes_written = fp.tell()
+        state.elapsed = now - self._started
+        state.done = final
+        self.progress(
+            PakProgress(
+                state.bytes_total,
+                state.bytes_read,
+                state.bytes_written,
+                state.entries_total,
+                state.entries_done,
+                state.elapsed,
+                state.done,
+            )
+        )
+
+    def _reusable(self, entry: PakEntry, stat: os.stat_result, previous) -> ManifestEntry:
+        # size + mtime only: hashing to confirm would cost the read we want to skip
+        if previous is None:
+            return None
+        manifest, infos = previous
+        old = manifest.get(entry.arcname)
+        if old is None or old.alias_of is not None or entry.arcname not in infos:
+            return None
+        if old.size != stat.st_size or old.mtime_ns != stat.st_mtime_ns:
+            return None
+        return old
+
+    def _known_duplicates(self, stats: Dict[int, os.stat_result], reused) -> Dict[int, str]:
+        # id(entry) -> digest for files the index already knows to repeat an
+        # earlier member's content; those are aliased without being read
+        if self.index is None or not self.dedup:
+            return {}
+        seen = set()
+        duplicates = {}
+        for entry in self.entries:
+            if entry.is_dir():
+                continue
+            stat = stats[id(entry)]
+            if id(entry) in reused:
+                digest = reused[id(entry)].hash
+            else:
+                known = self.index.lookup(entry.path, stat)
+                digest = known.hash if known is not None else None
+            if digest is None:
+                continue
+            if digest in seen and id(entry) not in reused and stat.st_size > 0:
+                duplicates[id(entry)] = digest
+            seen.add(digest)
+        return duplicates
+
+    def _learn(self, stats: Dict[int, os.stat_result]):
+        if self.index is None:
+            return
+        entries = {entry.arcname: entry for entry in self.entries if not entry.is_dir()}
+        self.index.record_many(
+            (entries[name].path, stats[id(entries[name])], {"hash": member.hash})
+            for name, member in self.manifest.entries.items()
+        )
+        self.index.record_encodings(
+            (member.hash, self.codec, member.method, member.compress_size)
+            for member in self.manifest.entries.values()
+            if member.alias_of is None
+        )
+
+    def _source_name(self, entry: PakEntry) -> str:
+        if self.root is not None and entry.path.is_relative_to(self.root):
+            return entry.path.relative_to(self.root).as_posix()
+        return entry.arcname
+
+    def _record(
+        self,
+        entry: PakEntry,
+        stat: os.stat_result,
+        zinfo: zipfile.ZipInfo,
+        digest: str,
+        cpu_seconds: float,
+        reused: bool = False,
+        alias_of: str = None,
+    ):
+        self.manifest.add(
+            ManifestEntry(
+                entry.arcname,
+                self._source_name(entry),
+                stat.st_size,
+                stat.st_mtime_ns,
+                digest,
+                zinfo.compress_type,
+                zinfo.CRC,
+                zinfo.compress_size if alias_of is None else 0,
+                zinfo.header_offset if alias_of is None else 0,
+                alias_of=alias_of,
+            )
+        )
+        self.report.append(
+            EntryReport(
+                entry.arcname,
+                zinfo.compress_type,
+                zinfo.file_size,
+                zinfo.compress_size if alias_of is None else 0,
+                cpu_seconds,
+                reused=reused,
+                alias_of=alias_of,
+            )
+        )
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._started = time.perf_counter()
+        stats = {
+            id(entry): os.stat(entry.path)
+            for entry in self.entries
+            if not entry.is_dir()
+        }
+        if self.codec == AUTO_CODEC:
+            self.codec = self._settled_codec(stats)
+        if self.codec == AUTO_CODEC:
+            self.codec, self.benchmarks = auto_codec(
+                [entry.path for entry in self.entries if not entry.is_dir()],
+                self.policy,
+                self.tolerance,
+            )
+        self.manifest.codec = self.codec
+        previous = self._previous()
+        self._progress = PakProgress(
+            bytes_total=sum(stat.st_size for stat in stats.values()),
+            entries_total=len(self.entries),
+        )
+        reused = {}
+        for entry in self.entries:
+            if not entry.is_dir():
+                old = self._reusable(entry, stats[id(entry)], previous)
+                if old is not None:
+                    reused[id(entry)] = old
+        duplicates = self._known_duplicates(stats, reused)
+        fresh = [
+            entry
+            for entry in self.entries
+            if not entry.is_dir() and id(entry) not in reused
+        ]
+        # decided by name, so nothing is read here: these are almost always
+        # stored, and _stream settles it on the first chunk
+        streamed = {
+            id(entry)
+            for entry in fresh
+            if entry.path.suffix.lower() in PRECOMPRESSED_EXTENSIONS or stats[id(entry)].st_size == 0
+        }
+        files = [
+            entry
+            for entry in fresh
+            if id(entry) not in streamed and id(entry) not in duplicates
+        ]
+        encoded = self._encode(files)
+        written: List[zipfile.ZipInfo] = []
+        stored: Dict[str, zipfile.ZipInfo] = {}  # digest -> first member with it
+        source = open(self.path, "rb") if reused else None
+        preallocate = self._expected_size(stats) if self.preallocate else 0
+        try:
+            with AtomicFile(self.path, self.buffering, preallocate) as fp:
+                for entry in self.entries:
+                    if entry.is_dir():
+                        zinfo = self._dir_info(entry)
+                        self._splice(fp, zinfo)
+                        written.append(zinfo)
+                        self._advance(fp)
+                        continue
+                    stat = stats[id(entry)]
+                    # bytes not yet counted towards progress for this entry
+                    unread = stat.st_size
+                    if id(entry) in reused:
+                        started = time.process_time()
+                        digest = reused[id(entry)].hash
+                        zinfo = previous[1][entry.arcname]
+                        if self.dedup and digest in stored and stat.st_size > 0:
+                            self._record(
+                                entry, stat, zinfo, digest, 0.0, alias_of=stored[digest].filename
+                            )
+                            self._advance(fp, stat.st_size)
+                            continue
+                        self._copy_member(fp, source, zinfo)
+                        cpu_seconds = time.process_time() - started
+                    elif duplicates.get(id(entry)) in stored:
+                        first = stored[duplicates[id(entry)]]
+                        zinfo = zipfile.ZipInfo.from_file(entry.path, entry.arcname)
+                        zinfo.compress_type = first.compress_type
+                        zinfo.file_size = first.file_size
+                        zinfo.compress_size = first.compress_size
+                        zinfo.CRC = first.CRC
+                        self._record(
+                            entry, stat, zinfo, duplicates[id(entry)], 0.0, alias_of=first.filename
+                        )
+                        self._advance(fp, stat.st_size)
+                        continue
+                    elif id(entry) in streamed:
+                        zinfo, digest, cpu_seconds = self._stream(fp, entry, stat)
+                        unread = 0
+                        if self.dedup and digest in stored and stat.st_size > 0:
+                            # already written; take it back and alias it instead
+                            fp.seek(zinfo.header_offset)
+                            fp.truncate()
+                            self._record(
+                                entry, stat, zinfo, digest, cpu_seconds, alias_of=stored[digest].filename
+                            )
+                            self._advance(fp)
+                            continue
+                    else:
+                        # a known duplicate whose original turned out to differ
+                        # from what the index said is encoded after all
+                        result = (
+                            next(encoded)
+                            if id(entry) not in duplicates
+                            else ingest_file(entry.path, self.codec, self.policy)
+                        )
+                        digest = result.digest
+                        zinfo = zipfile.ZipInfo.from_file(entry.path, entry.arcname)
+                        zinfo.compress_type = result.method
+                        zinfo.file_size = result.file_size
+                        zinfo.compress_size = len(result.data)
+                        zinfo.CRC = result.crc
+                        if result.method == zipfile.ZIP_LZMA:
+                            zinfo.flag_bits |= 0x02  # end-of-stream marker, as zipfile sets it
+                        if self.dedup and digest in stored and result.file_size > 0:
+                            self._record(
+                                entry,
+                                stat,
+                                zinfo,
+                                digest,
+                                result.cpu_seconds,
+                                alias_of=stored[digest].filename,
+                            )
+                            self._advance(fp, stat.st_size)
+                            continue
+                        self._splice(fp, zinfo, result.data)
+                        cpu_seconds = result.cpu_seconds
+                    stored.setdefault(digest, zinfo)
+                    written.append(zinfo)
+                    self._record(
+                        entry, stat, zinfo, digest, cpu_seconds, reused=id(entry) in reused
+                    )
+                    self._advance(fp, unread)
+                encoded.close()
+                if source is not None:
+                    source.close()
+                zinfo, packed = self._member_info(PAK_MANIFEST_NAME, self.manifest.to_member())
+                self._splice(fp, zinfo, packed)
+                written.append(zinfo)
+                start_dir = fp.tell()
+                for zinfo in written:
+                    fp.write(central_directory_record(zinfo))
+                end_dir = fp.tell()
+                fp.write(end_of_central_directory(len(written), end_dir - start_dir, start_dir))
+                self._advance(fp, final=True)
+        finally:
+            if source is not None:
+                source.close()
+        if self.incremental:
+            self.manifest.save(sidecar_path(self.path))
+        else:
+            # a full pack leaves nothing an incremental one could trust
+            sidecar_path(self.path).unlink(missing_ok=True)
+        self._learn(stats)
+
+
+def copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    # kernel-side copy from src at offset to dst at its current position;
+    # copy_file_range first, sendfile where that is missing or refused
+    if hasattr(os, "copy_file_range"):
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, offset_src=offset)
+        except OSError:
+            pass  # EXDEV/ENOSYS/EINVAL depending on kernel and filesystem
+    if hasattr(os, "sendfile"):
+        try:
+            return os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError:
+            pass
+    return os.write(dst_fd, os.pread(src_fd, min(count, CHUNK_SIZE), offset))
+
+
+@dataclass
+class PakMember:
+    name: str
+    header_offset: int
+    compress_size: int
+    file_size: int
+    method: int
+    crc: int
+
+    def is_dir(self):
+        return self.name.endswith("/")
+
+
+class MemoryReader(io.RawIOBase):
+    # seekable file object over a memoryview; reads never copy the mapping
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+        return
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._view) - self._pos)
+        if size <= 0:
+            return 0
+        buffer[:size] = self._view[self._pos : self._pos + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._pos + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        if position < 0:
+            raise ValueError("Negative seek position")
+        self._pos = position
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        self._view = memoryview(b"")
+        super().close()
+
+
+class DecompressReader(io.RawIOBase):
+    # streams a compressed member out of the mapping chunk by chunk
+    def __init__(self, view: memoryview, size: int, method: int):
+        self._view = view
+        self._size = size
+        self._decompressor = decompressor(method)
+        self._offset = 0
+        self._produced = 0
+        self._pending = b""
+        return
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending and self._produced < self._size:
+            chunk = self._view[self._offset : self._offset + DECOMPRESS_SIZE]
+            if not chunk:
+                break
+            self._offset += len(chunk)
+            self._pending = self._decompressor.decompress(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self._produced += size
+        return size
+
+    def close(self):
+        self._view = memoryview(b"")
+        super().close()
+
+
+class PakReader:
+    """
+    Random access into a .pak. The central directory is parsed once into a
+    name index; members are located through the mmap on demand, so opening a
+    pak and fetching one member does not depend on how many members it has.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise zipfile.BadZipFile(f"{self.path} is empty")
+        self._view = memoryview(self._map)
+        # extraction threads each get their own descriptor on the pak
+        self._local = threading.local()
+        self._fds: List[int] = []
+        self.members: Dict[str, PakMember] = self._read_central_directory()
+        self.manifest = PakManifest()
+        if PAK_MANIFEST_NAME in self.members:
+            self.manifest = PakManifest.from_member(self.read(PAK_MANIFEST_NAME))
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _read_central_directory(self) -> Dict[str, PakMember]:
+        tail_start = max(0, len(self._map) - zipfile.sizeEndCentDir - 0xFFFF)
+        end = self._map.rfind(zipfile.stringEndArchive, tail_start)
+        if end < 0:
+            raise zipfile.BadZipFile(f"{self.path} is not a pak")
+        record = struct.unpack(
+            zipfile.structEndArchive,
+            self._map[end : end + zipfile.sizeEndCentDir],
+        )
+        count, offset = record[4], record[6]
+        if count == 0xFFFF or offset == 0xFFFFFFFF:
+            raise zipfile.BadZipFile(f"{self.path} needs ZIP64, which paks never use")
+        members: Dict[str, PakMember] = {}
+        for _ in range(count):
+            fields = struct.unpack(
+                zipfile.structCentralDir,
+                self._map[offset : offset + zipfile.sizeCentralDir],
+            )
+            if fields[0] != zipfile.stringCentralDir:
+                raise zipfile.BadZipFile(f"{self.path} has a corrupt central directory")
+            name_start = offset + zipfile.sizeCentralDir
+            raw_name = self._map[name_start : name_start + fields[12]]
+            name = raw_name.decode("utf-8" if fields[5] & 0x800 else "cp437")
+            members[name] = PakMember(
+                name,
+                header_offset=fields[18],
+                compress_size=fields[10],
+                file_size=fields[11],
+                method=fields[6],
+                crc=fields[9],
+            )
+            offset = name_start + fields[12] + fields[13] + fields[14]
+        return members
+
+    def names(self) -> List[str]:
+        return [name for name in self.members if name != PAK_MANIFEST_NAME] + list(
+            self.manifest.aliases
+        )
+
+    def __contains__(self, name: str) -> bool:
+        return self.manifest.resolve(name) in self.members
+
+    def info(self, name: str) -> PakMember:
+        resolved = self.manifest.resolve(name)
+        if resolved not in self.members:
+            raise KeyError(f"There is no member named {name!r} in {self.path}")
+        return self.members[resolved]
+
+    def _payload_offset(self, member: PakMember) -> int:
+        offset = member.header_offset
+        fields = struct.unpack(
+            zipfile.structFileHeader,
+            self._map[offset : offset + zipfile.sizeFileHeader],
+        )
+        if fields[0] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"Bad local header for {member.name}")
+        return offset + zipfile.sizeFileHeader + fields[10] + fields[11]
+
+    def _payload(self, member: PakMember) -> memoryview:
+        start = self._payload_offset(member)
+        return self._view[start : start + member.compress_size]
+
+    def view(self, name: str) -> memoryview:
+        member = self.info(name)
+        if member.method != zipfile.ZIP_STORED:
+            raise ValueError(f"{name} is compressed and has no zero-copy view")
+        return self._payload(member)
+
+    def member(self, name: str):
+        # stored members as zero-copy views, compressed ones as streams
+        member = self.info(name)
+        if member.method == zipfile.ZIP_STORED:
+            return self._payload(member)
+        return self.open(name)
+
+    def open(self, name: str, seekable: bool = False) -> io.BufferedIOBase:
+        member = self.info(name)
+        if member.method == zipfile.ZIP_STORED:
+            return io.BufferedReader(MemoryReader(self._payload(member)))
+        if seekable:
+            return io.BytesIO(self.read(name))
+        return io.BufferedReader(
+            DecompressReader(self._payload(member), member.file_size, member.method),
+            CHUNK_SIZE,
+        )
+
+    def read(self, name: str) -> bytes:
+        member = self.info(name)
+        if member.method == zipfile.ZIP_STORED:
+            return bytes(self._payload(member))
+        with self.open(name) as f:
+            return f.read()
+
+    def verify(self, name: str) -> bool:
+        # checks a member against the size and BLAKE2 digest recorded at pack time
+        expected = self.manifest.checksums.get(name)
+        if expected is None:
+            return False
+        size, digest = expected
+        member = self.info(name)
+        if member.file_size != size:
+            return False
+        actual = new_hash()
+        if member.method == zipfile.ZIP_STORED:
+            actual.update(self._payload(member))
+        else:
+            with self.open(name) as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    actual.update(chunk)
+        return actual.hexdigest() == digest
+
+    def verify_all(self) -> List[str]:
+        return [
+            name
+            for name in self.names()
+            if not name.endswith("/") and not self.verify(name)
+        ]
+
+    def _worker_fd(self) -> int:
+        fd = getattr(self._local, "fd", None)
+        if fd is None:
+            fd = os.open(self.path, os.O_RDONLY)
+            self._local.fd = fd
+            self._fds.append(fd)
+        return fd
+
+    def _close_worker_fds(self):
+        while self._fds:
+            os.close(self._fds.pop())
+        self._local = threading.local()
+
+    def extract(self, name: str, target: Path) -> int:
+        # writes one member (aliases resolved) to target, checking its size
+        # and CRC-32 against the central directory on the way
+        member = self.info(name)
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        size = 0
+        with open(target, "wb") as out:
+            if member.method == zipfile.ZIP_STORED:
+                start = self._payload_offset(member)
+                fd = self._worker_fd()
+                while size < member.compress_size:
+                    copied = copy_range(fd, out.fileno(), start + size, member.compress_size - size)
+                    if copied <= 0:
+                        raise zipfile.BadZipFile(f"Truncated member {name}")
+                    size += copied
+                # the kernel did the copy; the CRC runs over the mapping,
+                # whose pages that copy just pulled into the cache
+                crc = zlib.crc32(self._payload(member))
+            else:
+                crc = 0
+                with self.open(name) as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        crc = zlib.crc32(chunk, crc)
+                        size += len(chunk)
+                        out.write(chunk)
+        if size != member.file_size:
+            raise zipfile.BadZipFile(f"Bad size for {name}: {size} != {member.file_size}")
+        if crc != member.crc:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for {name}")
+        return size
+
+    def extract_all(self, dest: Path, workers: int = None) -> List[Path]:
+        dest = Path(dest).resolve()
+        jobs = []
+        for name in self.names():
+            target = (dest / name).resolve()
+            if target != dest and dest not in target.parents:
+                raise zipfile.BadZipFile(f"{name} would extract outside {dest}")
+            if name.endswith("/"):
+                target.mkdir(parents=True, exist_ok=True)
+            else:
+                jobs.append((name, target))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda job: self.extract(*job), jobs))
+        finally:
+            self._close_worker_fds()
+        return [target for _, target in jobs]
+
+    def close(self):
+        self._close_worker_fds()
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # views handed out by view()/member() are still alive; the mapping
+            # goes away with them
+            pass
+        self._file.close()
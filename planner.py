@@ -0,0 +1,238 @@
+from pathlib import Path
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import bisect
+import math
+import time
+
+# resolution of the DP: the bytes over the cap are split into at most this
+# many units, and fewer when the table would exceed PLAN_OPS cells in total,
+# so solving stays in the milliseconds whatever the number of files
+PLAN_CELLS = 512
+PLAN_MIN_CELLS = 32
+PLAN_OPS = 1 << 17
+# nodes the exact search may visit before settling for the best plan so far
+PLAN_NODES = 50_000
+# how much losing a file of each kind hurts, when metadata says nothing
+KIND_PRIORITY = {
+    "tracks": 3.0,
+    "interrupts": 2.0,
+    "sfx": 1.0,
+    "intro": 1.0,
+    "cover": 1.0,
+    "README": 1.0,
+}
+RARITY_PRIORITY = {"common": 1.0, "rare": 2.0, "epic": 4.0}
+# priorities are compared as integers at this precision
+PRIORITY_SCALE = 100
+
+
+@dataclass
+class PruneItem:
+    path: Path
+    kind: str
+    size: int  # bytes it adds to the pak
+    priority: float
+
+
+@dataclass
+class PrunePlan:
+    cap: int
+    total: int  # estimated pak size before the plan
+    removals: List[PruneItem] = field(default_factory=list)
+    seconds: float = 0.0  # time spent solving
+    exact: bool = False  # the search finished, so no cheaper plan exists
+
+    def freed(self) -> int:
+        return sum(item.size for item in self.removals)
+
+    def projected(self) -> int:
+        return self.total - self.freed()
+
+    def fits(self) -> bool:
+        return self.projected() <= self.cap
+
+    def cost(self) -> float:
+        return sum(item.priority for item in self.removals)
+
+
+def metadata_priorities(metadata: dict) -> Dict[str, float]:
+    # file name -> priority from the pakets in metadata.json: an explicit
+    # "priority" wins over "rarity"
+    priorities = {}
+    for paket in (metadata or {}).get("pakets", []) or []:
+        if not isinstance(paket, dict):
+            continue
+        name = paket.get("localUrl") or paket.get("name")
+        if not name:
+            continue
+        if isinstance(paket.get("priority"), (int, float)):
+            priorities[Path(name).name] = float(paket["priority"])
+        elif paket.get("rarity") in RARITY_PRIORITY:
+            priorities[Path(name).name] = RARITY_PRIORITY[paket["rarity"]]
+    return priorities
+
+
+def _greedy(items: List[PruneItem], excess: int) -> List[PruneItem]:
+    # cheapest per byte first, for what the DP's rounding leaves over
+    chosen, freed = [], 0
+    for item in sorted(items, key=lambda item: item.priority / max(item.size, 1)):
+        if freed >= excess:
+            break
+        chosen.append(item)
+        freed += item.size
+    return chosen
+
+
+def _search(
+    items: List[PruneItem], excess: int, seed: List[PruneItem], nodes: int = PLAN_NODES
+) -> Tuple[List[PruneItem], bool]:
+    # branch and bound for the cheapest removals freeing at least excess,
+    # starting from seed as the plan to beat; the bound is the fractional
+    # relaxation, and within one priority a file is only taken when every
+    # bigger file of that priority is. Returns (removals, finished)
+    cost = [round(item.priority * PRIORITY_SCALE) for item in items]
+    order = sorted(
+        range(len(items)), key=lambda i: (cost[i] / max(items[i].size, 1), -items[i].size)
+    )
+    sizes = [items[i].size for i in order]
+    costs = [cost[i] for i in order]
+    size_sums, cost_sums = [0], [0]
+    for size, value in zip(sizes, costs):
+        size_sums.append(size_sums[-1] + size)
+        cost_sums.append(cost_sums[-1] + value)
+
+    def bound(i: int, need: int) -> int:
+        # cheapest fractional way to free need from the files at i onwards
+        m = bisect.bisect_left(size_sums, size_sums[i] + need, i + 1) - 1
+        left = need - (size_sums[m] - size_sums[i])
+        return cost_sums[m] - cost_sums[i] + math.ceil(costs[m] * left / max(sizes[m], 1))
+
+    seeded = {id(item) for item in seed}
+    best = sum(cost[i] for i, item in enumerate(items) if id(item) in seeded)
+    best_chosen = None
+    # (next file, bytes still needed, cost so far, chosen as a cons list, closed priorities)
+    stack = [(0, excess, 0, None, frozenset())]
+    while stack:
+        nodes -= 1
+        if nodes < 0:
+            break
+        i, need, spent, chosen, closed = stack.pop()
+        if need <= 0:
+            if spent < best:
+                best, best_chosen = spent, chosen
+            continue
+        if size_sums[-1] - size_sums[i] < need or spent + bound(i, need) >= best:
+            continue
+        value = costs[i]
+        # pushed first, so taking the file is explored first
+        stack.append((i + 1, need, spent, chosen, closed | {value}))
+        if value not in closed:
+            stack.append((i + 1, need - sizes[i], spent + value, (i, chosen), closed))
+    if best_chosen is None:
+        return seed, nodes >= 0
+    removals = []
+    while best_chosen is not None:
+        removals.append(items[order[best_chosen[0]]])
+        best_chosen = best_chosen[1]
+    return removals, nodes >= 0
+
+
+def plan_prune(
+    items: List[PruneItem], cap: int, overhead: int = 0, cells: int = PLAN_CELLS
+) -> PrunePlan:
+    """
+    The removals that bring overhead + the items' sizes under cap at the
+    least total priority, as a 0/1 knapsack over the bytes in excess.
+
+    A first plan comes from a DP with sizes bucketed into cells (rounded
+    down, so it never falls short of the cap) and items of equal priority
+    solved as one group, topped up greedily where the rounding leaves bytes
+    uncovered. A branch and bound search then starts from that plan; within
+    PLAN_NODES nodes it proves the plan optimal or finds the optimum, which
+    plan.exact records. Raises ValueError when even removing everything
+    cannot fit.
+    """
+    started = time.perf_counter()
+    total = overhead + sum(item.size for item in items)
+    plan = PrunePlan(cap, total)
+    excess = total - cap
+    if excess <= 0:
+        return plan
+    if sum(item.size for item in items) < excess:
+        raise ValueError(
+            f"Removing every prunable file still leaves the pak over {cap} bytes"
+        )
+    # within one priority the cheapest way to free bytes is always the
+    # biggest files first, so each priority is a single choice of "how many"
+    classes: Dict[int, List[PruneItem]] = defaultdict(list)
+    for item in items:
+        classes[round(item.priority * PRIORITY_SCALE)].append(item)
+    choices = 0
+    for members in classes.values():
+        members.sort(key=lambda item: item.size, reverse=True)
+        freed = 0
+        for item in members:
+            choices += 1
+            freed += item.size
+            if freed >= excess:
+                break
+    cells = max(PLAN_MIN_CELLS, min(cells, PLAN_OPS // choices))
+    unit = math.ceil(excess / cells)
+    need = math.ceil(excess / unit)
+    options: Dict[int, List[int]] = {}  # cost -> units freed by its k biggest
+    for cost, members in classes.items():
+        freed, weights = 0, [0]
+        for item in members:
+            freed += item.size
+            weights.append(min(need, freed // unit))
+            if weights[-1] >= need:
+                break
+        options[cost] = weights
+
+    # dp[j]: least cost to free at least j units; rows are kept to walk back
+    infinity = sum(cost * len(members) for cost, members in classes.items()) + 1
+    dp = [0] + [infinity] * need
+    rows = [dp]
+    for cost, weights in options.items():
+        best = dp
+        for k, weight in enumerate(weights[1:], 1):
+            shifted = [dp[0]] * weight + dp[: need + 1 - weight]
+            extra = k * cost
+            best = [
+                keep if keep <= take else take
+                for keep, take in zip(best, map(extra.__add__, shifted))
+            ]
+        dp = best
+        rows.append(dp)
+
+    chosen: List[PruneItem] = []
+    if dp[need] < infinity:
+        j = need
+        for index, (cost, weights) in reversed(list(enumerate(options.items(), 1))):
+            for k, weight in enumerate(weights):
+                if rows[index - 1][max(0, j - weight)] + k * cost == rows[index][j]:
+                    chosen += classes[cost][:k]
+                    j = max(0, j - weight)
+                    break
+    freed = sum(item.size for item in chosen)
+    if freed < excess:
+        picked = {id(item) for item in chosen}
+        chosen += _greedy([item for item in items if id(item) not in picked], excess - freed)
+        freed = sum(item.size for item in chosen)
+    # the rounded plan is only the one to beat: the search either proves
+    # nothing is cheaper or finds what is
+    chosen, plan.exact = _search(items, excess, chosen)
+    freed = sum(item.size for item in chosen)
+    # rounding can free more than needed: keep back what still fits,
+    # most valuable first
+    kept = set()
+    for item in sorted(chosen, key=lambda item: item.priority, reverse=True):
+        if freed - item.size >= excess:
+            kept.add(id(item))
+            freed -= item.size
+    chosen = [item for item in chosen if id(item) not in kept]
+    plan.removals = sorted(chosen, key=lambda item: item.size, reverse=True)
+    plan.seconds = time.perf_counter() - started
+    return plan
@@ -0,0 +1,288 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+import mmap
+import os
+
+# bytes read across a whole probe; past it every file is scanned from the
+# start for a proportional share, so big folders cost the same as small ones
+PROBE_BUDGET = 256 * 1024 * 1024
+# never scan less than this much of a file, even when the budget is tight
+PROBE_MIN_SCAN = 256 * 1024
+# how much scanning one pool task gets, so workers balance on bytes, not files
+PROBE_BATCH = 16 * 1024 * 1024
+# frames a file needs before it counts as MPEG audio at all
+MIN_FRAMES = 4
+# share of the scanned bytes that may be junk between frames
+JUNK_TOLERANCE = 0.01
+
+# kbps by (version is 1, layer) and bitrate index; index 0 (free) and 15 are invalid
+BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# version bits -> sample rates; 0b01 is reserved
+SAMPLE_RATES = {
+    0b11: [44100, 48000, 32000],
+    0b10: [22050, 24000, 16000],
+    0b00: [11025, 12000, 8000],
+}
+VERSIONS = {0b11: "1", 0b10: "2", 0b00: "2.5"}
+
+
+@dataclass(frozen=True)
+class FrameHeader:
+    version: str
+    layer: int
+    bitrate: int  # kbps
+    sample_rate: int
+    length: int  # bytes, header included
+    samples: int
+
+
+@dataclass
+class ProbeReport:
+    path: Path
+    size: int
+    scanned: int = 0  # bytes read, ID3 tags included
+    frames: int = 0
+    junk: int = 0  # bytes skipped while resyncing
+    seconds: float = 0.0  # audio covered by the scanned frames
+    bitrates: Set[int] = field(default_factory=set)
+    sample_rates: Set[int] = field(default_factory=set)
+    layers: Set[str] = field(default_factory=set)
+    truncated: bool = False  # the last frame runs past the end of the file
+    error: Optional[str] = None
+
+    def ok(self) -> bool:
+        return self.error is None
+
+    def complete(self) -> bool:
+        return self.scanned >= self.size
+
+    def vbr(self) -> bool:
+        return len(self.bitrates) > 1
+
+    def to_dict(self):
+        return {
+            "path": str(self.path),
+            "size": self.size,
+            "scanned": self.scanned,
+            "frames": self.frames,
+            "junk": self.junk,
+            "seconds": round(self.seconds, 3),
+            "bitrates": sorted(self.bitrates),
+            "sample_rates": sorted(self.sample_rates),
+            "layers": sorted(self.layers),
+            "truncated": self.truncated,
+            "error": self.error,
+        }
+
+    def from_dict(data: dict) -> "ProbeReport":
+        return ProbeReport(
+            Path(data["path"]),
+            data["size"],
+            data["scanned"],
+            data["frames"],
+            data["junk"],
+            data["seconds"],
+            set(data["bitrates"]),
+            set(data["sample_rates"]),
+            set(data["layers"]),
+            data["truncated"],
+            data["error"],
+        )
+
+
+def parse_header(data, offset: int) -> Optional[FrameHeader]:
+    # the 4-byte frame header at offset, or None when it is not one
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2 = data[offset], data[offset + 1], data[offset + 2]
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version_bits = (b1 >> 3) & 0b11
+    layer_bits = (b1 >> 1) & 0b11
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0b11
+    if version_bits == 0b01 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    layer = 4 - layer_bits
+    v1 = version_bits == 0b11
+    bitrate = BITRATES[(v1, layer)][bitrate_index]
+    sample_rate = SAMPLE_RATES[version_bits][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+        samples = 384
+    elif layer == 3 and not v1:
+        length = 72 * bitrate * 1000 // sample_rate + padding
+        samples = 576
+    else:
+        length = 144 * bitrate * 1000 // sample_rate + padding
+        samples = 1152
+    return FrameHeader(VERSIONS[version_bits], layer, bitrate, sample_rate, length, samples)
+
+
+def id3v2_size(data) -> int:
+    # bytes taken by a leading ID3v2 tag, 0 when there is none
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _resync(data, offset: int, end: int) -> Optional[int]:
+    # next offset holding a header that is followed by another valid header,
+    # which rules out most stray 0xFF bytes inside audio data
+    while True:
+        offset = data.find(b"\xff", offset, end)
+        if offset == -1:
+            return None
+        header = parse_header(data, offset)
+        if header is not None:
+            following = offset + header.length
+            if following + 4 > end or parse_header(data, following) is not None:
+                return offset
+        offset += 1
+
+
+def scan_frames(data, report: ProbeReport, limit: int):
+    # walks the frames in the first limit bytes after any ID3v2 tag,
+    # filling in report
+    start = id3v2_size(data)
+    if start >= len(data):
+        report.scanned = len(data)
+        report.error = "ID3 tag runs past the end of the file"
+        return
+    end = min(start + limit, len(data))
+    report.scanned = end
+    offset = _resync(data, start, end)
+    if offset is None:
+        report.junk = end - start
+        return
+    report.junk = offset - start
+    while offset < end:
+        header = parse_header(data, offset)
+        if header is None:
+            if data[offset : offset + 3] == b"TAG" and len(data) - offset == 128:
+                break  # trailing ID3v1 tag
+            if data[offset : offset + 8] == b"APETAGEX":
+                break  # trailing APE tag
+            found = _resync(data, offset + 1, end)
+            if found is None:
+                report.junk += end - offset
+                break
+            report.junk += found - offset
+            offset = found
+            continue
+        if offset + header.length > len(data):
+            report.truncated = True
+            break
+        report.frames += 1
+        report.seconds += header.samples / header.sample_rate
+        report.bitrates.add(header.bitrate)
+        report.sample_rates.add(header.sample_rate)
+        report.layers.add(f"MPEG-{header.version} layer {header.layer}")
+        offset += header.length
+
+
+def probe_file(path: Path, limit: int = None) -> ProbeReport:
+    # scans up to limit bytes of audio in path (all of it by default)
+    path = Path(path)
+    size = os.path.getsize(path)
+    report = ProbeReport(path, size)
+    if size == 0:
+        report.error = "file is empty"
+        return report
+    limit = size if limit is None else limit
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        scan_frames(data, report, limit)
+    if report.error is None:
+        report.error = verdict(report)
+    return report
+
+
+def verdict(report: ProbeReport) -> Optional[str]:
+    if report.frames < MIN_FRAMES:
+        return "no MPEG audio frames found"
+    if len(report.sample_rates) > 1:
+        rates = ", ".join(str(rate) for rate in sorted(report.sample_rates))
+        return f"sample rate changes mid-stream ({rates} Hz)"
+    if len(report.layers) > 1:
+        return "MPEG version or layer changes mid-stream"
+    if report.junk > JUNK_TOLERANCE * max(report.scanned, 1):
+        return f"{report.junk} bytes of garbage between frames"
+    if report.truncated:
+        return "last frame is cut short"
+    return None
+
+
+def scan_limits(sizes: List[int], budget: int = PROBE_BUDGET) -> List[int]:
+    # bytes to scan per file so the total stays within budget
+    total = sum(sizes)
+    if total <= budget:
+        return list(sizes)
+    share = budget / total
+    return [min(size, max(PROBE_MIN_SCAN, int(size * share))) for size in sizes]
+
+
+def plan_batches(limits: List[int], batch: int = PROBE_BATCH) -> List[List[int]]:
+    # indexes grouped into tasks of about `batch` bytes each, largest first,
+    # so one huge track and a hundred tiny sfx weigh what they cost to read
+    batches: List[List[int]] = []
+    current, current_bytes = [], 0
+    for index in sorted(range(len(limits)), key=lambda i: limits[i], reverse=True):
+        current.append(index)
+        current_bytes += limits[index]
+        if current_bytes >= batch:
+            batches.append(current)
+            current, current_bytes = [], 0
+    if current:
+        batches.append(current)
+    return batches
+
+
+def probe_batch(paths: List[Path], limits: List[int]) -> List[ProbeReport]:
+    # runs in a worker process
+    return [probe_file(path, limit) for path, limit in zip(paths, limits)]
+
+
+def probe_all(
+    paths: List[Path],
+    budget: int = PROBE_BUDGET,
+    workers: int = None,
+    sizes: List[int] = None,
+    limits: List[int] = None,
+) -> Dict[Path, ProbeReport]:
+    # path -> report; sizes saves the stat calls when the caller has them,
+    # limits overrides the per-file share of the budget
+    paths = [Path(path) for path in paths]
+    if not paths:
+        return {}
+    if limits is None:
+        sizes = sizes if sizes is not None else [os.path.getsize(path) for path in paths]
+        limits = scan_limits(sizes, budget)
+    batches = plan_batches(limits)
+    if workers == 1 or len(batches) == 1:
+        # not worth spinning up a pool for
+        reports = probe_batch(paths, limits)
+    else:
+        reports: List[ProbeReport] = [None] * len(paths)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                (batch, pool.submit(probe_batch, [paths[i] for i in batch], [limits[i] for i in batch]))
+                for batch in batches
+            ]
+            for batch, future in futures:
+                for index, report in zip(batch, future.result()):
+                    reports[index] = report
+    return {report.path: report for report in reports}
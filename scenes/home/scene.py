@@ -16,7 +16,8 @@ from simple_renderer import (
     Engine,
 )
 from pathlib import Path
-from files import FileHandler, TempTree
+from files import FileHandler
+from session import Session
 from typing import List
 from db import db
 import utils
@@ -24,6 +25,11 @@ import random
 import time
 
 
+def file_handler() -> FileHandler:
+    # the session's, so the scene works in the same workspace as the modes
+    return Session().file_handler
+
+
 class LogoDisplay(TypedBlock):
     def __init__(self, speed: float = 0.2):
         super().__init__(
@@ -101,7 +107,7 @@ class FileReaderDisplay(TypedBlock):
 
     def on_start(self):
         self.ctx().set(files=self.paths)
-        self.lines = [f" > Reading file: {path}" for path in TempTree.list_files()]
+        self.lines = [f" > Reading file: {path}" for path in file_handler().tree.list_files()]
         return
 
     def render(self):
@@ -117,6 +123,7 @@ class FileHandlerDisplay(Question):
 
     def on_start(self):
         self._engine._dependency_graph.add_edge(self, "file_size")
+        self._engine._dependency_graph.add_edge(self, "pak_bytes")
         return
 
     def after_render(self, ctx: "Context"):
@@ -125,18 +132,21 @@ class FileHandlerDisplay(Question):
             fg=utils.ForegroundColor.Green,
             bg=utils.BackgroundColor.Black,
         )
-        size = self.ctx().get("file_size")
+        # file_size is the estimate made at import; pak_bytes is the raw
+        # total, which pruning keeps current
+        size, pak_bytes = self.ctx().get("file_size", "pak_bytes")
         Engine.debug("[file handler info] File size from ctx.get('file_size')", size, trace=True)
         if size > 10:
             Engine.debug("[file handler info] File size exceeded 10MB", trace=True)
             self.append_node(
                 Group(
                     [
-                        FileReaderDisplay(TempTree.list_files()),
+                        FileReaderDisplay(file_handler().tree.list_files()),
                         TypedBlock(
                             [
                                 db["scenes"]["home"]["file_size_exceeded"],
-                                f"Actual size: {size}MB",
+                                f"Estimated pak size: {size:.2f}MB",
+                                f"Files: {utils.format_bytes(pak_bytes)}",
                                 "Drop in a smaller pak by typing 'new' or select prune to drop selected files",
                             ],
                             static=True,
@@ -149,12 +159,29 @@ class FileHandlerDisplay(Question):
 
     def on_response(self, path: str):
         resp = FileHandler.process_file(path)
-        if resp.valid:
-            files = FileHandler.list_files(resp.path)
-            FileHandler.copy_to_temp(resp.path)
+        if not resp.valid:
+            self.append_node(TypedText(resp.error, static=True))
+        elif resp.path.suffix.lower() == ".pak":
+            # a finished pak is auditioned straight out of the archive
+            try:
+                Session().audio_manager.load_pak(resp.path)
+            except Exception as e:
+                self.append_node(TypedText(f"Cannot play {resp.path}: {e}", static=True))
+                return
+            size = resp.path.stat().st_size
+            self.ctx().set(file_size=size / (1024 * 1024), pak_bytes=size)
+        else:
+            handler = file_handler()
+            handler.stage(resp.path, inventory=resp.inventory)
+            files = (
+                resp.inventory.names()
+                if resp.inventory is not None
+                else FileHandler.list_files(handler.tree.root())
+            )
             # self.ctx().set(files=files)
-            size = FileHandler.calc_total_pak_size(resp.path)
-            self.ctx().set(file_size=size)
+            # predicted size of the packed archive, not the raw folder size
+            size = handler.estimate_pak_size() / (1024 * 1024)
+            self.ctx().set(file_size=size, pak_bytes=handler.tree.total_size())
             Engine.debug(f"Reachted this point ")
             Engine.debug()
             Engine.debug((f"[on_response] self id: {id(self)}"))
@@ -76,6 +76,7 @@ class SessionEvents(Enum):
     default_mode_ended = "default_mode_ended"
     pruning_mode_started = "pruning_mode_started"
     pruning_mode_ended = "pruning_mode_ended"
+    pak_progress = "pak_progress"
 
 class Mode(Enum):
     DEFAULT = "default"
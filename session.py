@@ -37,9 +37,11 @@ class Session:
             cls._instance = super(Session, cls).__new__(cls)
             cls.events: Events = Events()
             cls.io: IoManager = IoManager()
-            cls.file_handler: FileHandler = FileHandler(cls)
-            cls.temptree: TempTree = TempTree(cls)
-            cls.audio_manager: AudioManager = AudioManager(cls)
+            # a workspace of its own, so side-by-side sessions never collide
+            cls.temptree: TempTree = TempTree()
+            atexit.register(Session.sigint_exit)
+            cls.file_handler: FileHandler = FileHandler(cls.temptree)
+            cls.audio_manager: AudioManager = AudioManager(cls, cls.temptree)
             cls.sys_messenger: Messenger = Messenger()
             cls.graphics: Graphics = Graphics()
             cls.state: SessionState = SessionState()
@@ -61,12 +63,11 @@ class Session:
         self.io.start()
         IoStream.start()
         self.events.emit(SessionEvents.session_started)
-        atexit.register(Session.sigint_exit)
         return
 
     def sigint_exit():
         try:
-            FileHandler.clear_temp()
+            Session.temptree.cleanup(wait=True)
         except KeyboardInterrupt:
             pass
 
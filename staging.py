@@ -0,0 +1,149 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import errno
+import fcntl
+import os
+import threading
+import time
+
+# linux ioctl that shares the source's extents with the destination (btrfs, xfs, ...)
+FICLONE = 0x40049409
+COPY_CHUNK = 8 * 1024 * 1024
+STAGE_WORKERS = 4
+# errors meaning "this filesystem pair cannot do that", as opposed to real failures
+UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EMLINK}
+
+
+@dataclass
+class StageReport:
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    # strategy -> files staged with it; "empty" for zero-byte files
+    strategies: Dict[str, int] = field(default_factory=dict)
+
+    def throughput(self) -> float:
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def strategy(self) -> str:
+        # the one that did most of the work
+        if not self.strategies:
+            return "none"
+        return max(self.strategies, key=self.strategies.get)
+
+    def to_dict(self):
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 6),
+            "throughput": round(self.throughput()),
+            "strategy": self.strategy(),
+            "strategies": self.strategies,
+        }
+
+
+class Stager:
+    """
+    Mirrors a folder into another one as cheaply as the filesystems allow:
+    hard link, then reflink, then copy_file_range, then a chunked read/write.
+    A strategy that fails as unsupported once is not tried again.
+    """
+
+    def __init__(self, workers: int = STAGE_WORKERS):
+        self.workers = workers
+        self._disabled = set()
+        self._lock = threading.Lock()
+        return
+
+    def _disable(self, strategy: str):
+        with self._lock:
+            self._disabled.add(strategy)
+
+    def _hardlink(self, source: Path, target: Path):
+        os.link(source, target)
+
+    def _reflink(self, src_fd: int, dst_fd: int, size: int):
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+    def _copy_file_range(self, src_fd: int, dst_fd: int, size: int):
+        copied = 0
+        while copied < size:
+            count = os.copy_file_range(src_fd, dst_fd, size - copied)
+            if count == 0:
+                break
+            copied += count
+
+    def _chunked(self, src_fd: int, dst_fd: int, size: int):
+        while chunk := os.read(src_fd, COPY_CHUNK):
+            os.write(dst_fd, chunk)
+
+    def stage_file(self, source: Path, target: Path) -> str:
+        # the name of the strategy that staged the file
+        if target.exists():
+            target.unlink()
+        if "hardlink" not in self._disabled:
+            try:
+                self._hardlink(source, target)
+                return "hardlink"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+                self._disable("hardlink")
+        size = os.path.getsize(source)
+        strategies = [("reflink", self._reflink)]
+        if hasattr(os, "copy_file_range"):
+            strategies.append(("copy_file_range", self._copy_file_range))
+        src_fd = os.open(source, os.O_RDONLY)
+        try:
+            dst_fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                if size == 0:
+                    # opening with O_TRUNC already made the empty copy
+                    return "empty"
+                for name, strategy in strategies:
+                    if name in self._disabled:
+                        continue
+                    try:
+                        strategy(src_fd, dst_fd, size)
+                        return name
+                    except OSError as e:
+                        if e.errno not in UNSUPPORTED:
+                            raise
+                        self._disable(name)
+                        # copy_file_range may have moved both offsets before
+                        # failing; the next strategy starts over on both sides
+                        os.lseek(src_fd, 0, os.SEEK_SET)
+                        os.ftruncate(dst_fd, 0)
+                        os.lseek(dst_fd, 0, os.SEEK_SET)
+                self._chunked(src_fd, dst_fd, size)
+                return "copy"
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+
+    def stage_tree(self, source: Path, target: Path, skip=None) -> StageReport:
+        # skip(entry) -> True leaves a file or folder out, e.g. hidden files
+        started = time.perf_counter()
+        source, target = Path(source), Path(target)
+        jobs: List[Tuple[Path, Path]] = []
+        for folder, dirs, files in os.walk(source):
+            relative = Path(folder).relative_to(source)
+            dirs[:] = [name for name in dirs if skip is None or not skip(Path(folder) / name)]
+            (target / relative).mkdir(parents=True, exist_ok=True)
+            for name in files:
+                if skip is None or not skip(Path(folder) / name):
+                    jobs.append((Path(folder) / name, target / relative / name))
+        report = StageReport(files=len(jobs))
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for (path, _), strategy in zip(jobs, pool.map(lambda job: self.stage_file(*job), jobs)):
+                report.bytes += os.path.getsize(path)
+                report.strategies[strategy] = report.strategies.get(strategy, 0) + 1
+        report.seconds = time.perf_counter() - started
+        return report
+
+
+def stage_tree(source: Path, target: Path, skip=None, workers: int = STAGE_WORKERS) -> StageReport:
+    return Stager(workers).stage_tree(source, target, skip)
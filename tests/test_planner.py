@@ -0,0 +1,48 @@
+from pathlib import Path
+import itertools
+import random
+
+from planner import PRIORITY_SCALE, PruneItem, plan_prune
+
+
+def brute_force(items, excess):
+    # least scaled cost of any subset freeing at least excess
+    best = None
+    for count in range(len(items) + 1):
+        for combo in itertools.combinations(items, count):
+            if sum(item.size for item in combo) >= excess:
+                cost = sum(round(item.priority * PRIORITY_SCALE) for item in combo)
+                best = cost if best is None else min(best, cost)
+    return best
+
+
+def items_of(pairs):
+    return [PruneItem(Path(f"tracks/{i}.mp3"), "tracks", size, priority) for i, (size, priority) in enumerate(pairs)]
+
+
+def test_rounding_case_is_optimal():
+    pairs = [
+        (718661, 3), (102841, 1), (4404394, 2), (3686294, 1),
+        (1583131, 1), (4918378, 1), (4662949, 1), (2556570, 3),
+    ]
+    items = items_of(pairs)
+    total = sum(size for size, _ in pairs)
+    plan = plan_prune(items, total - 21914371)
+    assert plan.fits()
+    assert plan.exact
+    assert plan.cost() == 10
+
+
+def test_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(1000):
+        pairs = [
+            (rng.randint(1, 5_000_000), rng.choice([1.0, 1.5, 2.0, 3.0, 4.0]))
+            for _ in range(rng.randint(1, 9))
+        ]
+        items = items_of(pairs)
+        total = sum(size for size, _ in pairs)
+        cap = rng.randint(0, total)
+        plan = plan_prune(items, cap)
+        assert plan.fits()
+        assert round(plan.cost() * PRIORITY_SCALE) == (brute_force(items, total - cap) or 0)
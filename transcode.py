@@ -0,0 +1,148 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+import os
+import shutil
+import subprocess
+import tempfile
+from mutagen.mp3 import MP3
+from manifest import hash_file
+from ingest import CACHE_ROOT
+
+# CBR bitrates every MP3 encoder accepts, in kbps
+BITRATES = [320, 256, 224, 192, 160, 128, 112, 96, 80, 64, 56, 48, 40, 32]
+# frame headers and padding on top of duration * bitrate
+FRAME_OVERHEAD = 1.02
+CACHE_DIR = CACHE_ROOT / "transcode"
+
+
+@dataclass
+class TranscodeReport:
+    source: Path
+    output: Path
+    bitrate: int
+    source_size: int
+    size: int
+    cached: bool = False
+    skipped: bool = False  # already at or below the target bitrate
+
+    def saved(self) -> int:
+        return self.source_size - self.size
+
+
+def find_encoder() -> Optional[str]:
+    # local binaries only, so transcoding works offline
+    return shutil.which("ffmpeg") or shutil.which("lame")
+
+
+def encoder_command(encoder: str, source: Path, output: Path, bitrate: int) -> List[str]:
+    if Path(encoder).name.startswith("lame"):
+        return [encoder, "--quiet", "--mp3input", "-b", str(bitrate), str(source), str(output)]
+    # -map_metadata -1 / -vn drop tags and embedded art along with the bits
+    return [
+        encoder,
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        str(source),
+        "-vn",
+        "-map_metadata",
+        "-1",
+        "-codec:a",
+        "libmp3lame",
+        "-b:a",
+        f"{bitrate}k",
+        "-f",
+        "mp3",
+        str(output),
+    ]
+
+
+def duration(path: Path) -> float:
+    try:
+        return MP3(path).info.length
+    except Exception:
+        return 0.0
+
+
+def source_bitrate(path: Path) -> int:
+    try:
+        return MP3(path).info.bitrate // 1000
+    except Exception:
+        return 0
+
+
+def choose_bitrate(seconds: float, budget: int) -> Optional[int]:
+    # highest CBR rate whose output for `seconds` of audio fits in budget bytes
+    for bitrate in BITRATES:
+        if seconds * bitrate * 1000 / 8 * FRAME_OVERHEAD <= budget:
+            return bitrate
+    return None
+
+
+def cache_path(digest: str, bitrate: int, cache_dir: Path = CACHE_DIR) -> Path:
+    return Path(cache_dir) / f"{digest}-{bitrate}k.mp3"
+
+
+def transcode_file(
+    path: Path, bitrate: int, encoder: str, cache_dir: Path = CACHE_DIR
+) -> TranscodeReport:
+    # runs in a worker process; encodes are keyed by (source hash, bitrate)
+    path = Path(path)
+    source_size = os.path.getsize(path)
+    if 0 < source_bitrate(path) <= bitrate:
+        return TranscodeReport(path, path, bitrate, source_size, source_size, skipped=True)
+    output = cache_path(hash_file(path), bitrate, cache_dir)
+    if output.is_file():
+        size = output.stat().st_size
+        if size >= source_size:
+            output.unlink(missing_ok=True)
+            return TranscodeReport(path, path, bitrate, source_size, source_size, skipped=True)
+        return TranscodeReport(path, output, bitrate, source_size, size, cached=True)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    fd, partial = tempfile.mkstemp(dir=output.parent, prefix=f".{output.stem}.", suffix=".mp3")
+    os.close(fd)
+    try:
+        subprocess.run(
+            encoder_command(encoder, path, Path(partial), bitrate),
+            check=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        os.replace(partial, output)
+    finally:
+        Path(partial).unlink(missing_ok=True)
+    size = output.stat().st_size
+    if size >= source_size:
+        # the encoder could not beat the source; keep the original, and
+        # don't cache an output no run should ever use
+        output.unlink(missing_ok=True)
+        return TranscodeReport(path, path, bitrate, source_size, source_size, skipped=True)
+    return TranscodeReport(path, output, bitrate, source_size, size)
+
+
+def transcode_all(
+    paths: List[Path],
+    bitrate: int,
+    encoder: str = None,
+    workers: int = None,
+    cache_dir: Path = CACHE_DIR,
+) -> List[TranscodeReport]:
+    encoder = encoder if encoder is not None else find_encoder()
+    if encoder is None:
+        raise FileNotFoundError("No local MP3 encoder found (install ffmpeg or lame)")
+    if not paths:
+        return []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(
+                transcode_file,
+                paths,
+                [bitrate] * len(paths),
+                [encoder] * len(paths),
+                [cache_dir] * len(paths),
+            )
+        )
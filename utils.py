@@ -7,7 +7,6 @@ from typing import Any, Callable, List
 from enum import Enum
 from alive_progress import alive_bar, styles
 from alive_progress.styles import showtime
-from audio import TrackInfo
 from rich.console import Console
 from rich.table import Table
 from rich.align import Align
@@ -230,6 +229,34 @@ class BarSpinner:
             self._thread.join()
         writ_to_line("")
 
+def format_bytes(size: float) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+class ProgressBar:
+
+    def __init__(self, label: str = "", width: int = 30):
+        self.label = label
+        self.width = width
+
+    def update(self, done: int, total: int, rate: float = 0.0, eta: float = None):
+        fraction = min(1.0, done / total) if total else 1.0
+        filled = int(self.width * fraction)
+        bar = "█" * filled + "░" * (self.width - filled)
+        remaining = "--" if eta is None else f"{eta:.0f}s"
+        writ_to_line(
+            f"{self.label}[{bar}] {fraction * 100:5.1f}% "
+            f"{format_bytes(done)}/{format_bytes(total)} "
+            f"{format_bytes(rate)}/s ETA {remaining}"
+        )
+
+    def finish(self):
+        print("")
+
 class AudioAnimation:
 
     def __init__(self, delay: float = 0.1):
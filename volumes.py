@@ -0,0 +1,132 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, List
+import json
+import os
+import tempfile
+import time
+
+from compression import (
+    DEFAULT_CODEC,
+    CompressionPolicy,
+    EntryReport,
+    estimate_entry_size,
+    estimate_overhead,
+)
+from pak import PakEntry, PakProgress, PakWriter
+
+VOLUMES_NAME = "volumes.json"
+
+
+@dataclass
+class Volume:
+    name: str
+    entries: List[PakEntry] = field(default_factory=list)
+    estimated_size: int = 0
+
+
+def plan_volumes(
+    entries: List[PakEntry],
+    cap: int,
+    stem: str,
+    policy: CompressionPolicy = None,
+) -> List[Volume]:
+    # first-fit-decreasing over upper bounds of the compressed sizes, so a
+    # volume never lands over the cap; an entry bigger than the cap on its
+    # own still gets a volume of its own
+    policy = policy if policy is not None else CompressionPolicy()
+    sized = sorted(
+        ((estimate_entry_size(entry, policy, upper_bound=True), entry) for entry in entries),
+        key=lambda pair: pair[0],
+        reverse=True,
+    )
+    budget = cap - estimate_overhead([])
+    volumes: List[Volume] = []
+    for size, entry in sized:
+        # each entry also grows its volume's manifest.json
+        cost = size + estimate_overhead([entry]) - estimate_overhead([])
+        for volume in volumes:
+            if volume.estimated_size + cost <= budget:
+                break
+        else:
+            volume = Volume(f"{stem}.{len(volumes) + 1:03d}.pak")
+            volumes.append(volume)
+        volume.entries.append(entry)
+        volume.estimated_size += cost
+    # keep the pak layout order inside each volume
+    order = {id(entry): index for index, entry in enumerate(entries)}
+    for volume in volumes:
+        volume.estimated_size += estimate_overhead([])
+        volume.entries.sort(key=lambda entry: order[id(entry)])
+    return volumes
+
+
+def pack_volume(
+    path: str, entries: List[PakEntry], codec: str = DEFAULT_CODEC
+) -> List[EntryReport]:
+    # runs in a worker process; each volume is packed serially inside it
+    with PakWriter(path, workers=1, codec=codec) as pak:
+        for entry in entries:
+            pak.add(entry)
+    return pak.report
+
+
+def write_volumes(
+    out_dir: Path,
+    stem: str,
+    index_entries: List[PakEntry],
+    volume_entries: List[PakEntry],
+    cap: int,
+    workers: int = None,
+    codec: str = DEFAULT_CODEC,
+    progress: Callable[[PakProgress], None] = None,
+):
+    # progress is reported per finished volume, the unit the pool hands back
+    started = time.perf_counter()
+    out_dir = Path(out_dir)
+    volumes = plan_volumes(volume_entries, cap, stem)
+    paths = [str(out_dir / volume.name) for volume in volumes]
+    sizes = [
+        sum(os.path.getsize(entry.path) for entry in volume.entries) for volume in volumes
+    ]
+    state = PakProgress(bytes_total=sum(sizes), entries_total=len(volume_entries))
+    reports: List[List[EntryReport]] = [None] * len(volumes)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(pack_volume, path, volume.entries, codec): index
+            for index, (volume, path) in enumerate(zip(volumes, paths))
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            reports[index] = future.result()
+            state.bytes_read += sizes[index]
+            state.bytes_written += os.path.getsize(paths[index])
+            state.entries_done += len(volumes[index].entries)
+            state.elapsed = time.perf_counter() - started
+            if progress is not None:
+                progress(PakProgress(**vars(state)))
+    index = {
+        "cap": cap,
+        "volumes": [
+            {
+                "name": volume.name,
+                "size": os.path.getsize(path),
+                "entries": [entry.arcname for entry in volume.entries],
+            }
+            for volume, path in zip(volumes, paths)
+        ],
+    }
+    # the index pak holds metadata, cover and README plus the volume listing
+    with tempfile.TemporaryDirectory(prefix="pakkit-") as scratch:
+        listing = Path(scratch) / VOLUMES_NAME
+        listing.write_text(json.dumps(index, indent=2))
+        with PakWriter(out_dir / f"{stem}.pak", workers=1, codec=codec) as pak:
+            for entry in index_entries:
+                pak.add(entry)
+            pak.write(listing, VOLUMES_NAME)
+    if progress is not None:
+        state.elapsed = time.perf_counter() - started
+        state.done = True
+        progress(state)
+    return index, reports